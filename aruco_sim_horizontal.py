@@ -1,16 +1,26 @@
+import argparse
 import pygame
 import random
 import cv2
 import socket
 import time
 
+from session_log import SessionRecorder
+from session_metrics import SessionMetrics
+from session_store import SessionStore
+
+WIDTH, HEIGHT = 3440, 1400
+
 
 class ArUcoSimulation:
-    def __init__(self, marker_id=0, marker_size=300, speed_x=30, speed_y=30):
+    def __init__(self, marker_id=0, marker_size=300, speed_x=30, speed_y=30, session_dir=None, metrics_channel=False,
+                 planned_path=None, sync_patch=None, store_dir=None, monitor=None):
         self.aruco_dict = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50)
         self.marker_image = cv2.aruco.generateImageMarker(self.aruco_dict, marker_id, marker_size)
         cv2.imwrite("ArucoMarker/aruco_marker.png", self.marker_image)
 
+        self.marker_id = marker_id
+        self.marker_size = marker_size
         self.speed_x = speed_x
         self.speed_y = speed_y
         self.paused = False
@@ -19,7 +29,7 @@ class ArUcoSimulation:
         self.pygame = pygame
         self.pygame.init()
         display_info = self.pygame.display.Info()
-        self.width, self.height = 3440, 1400
+        self.width, self.height = WIDTH, HEIGHT
         self.window = self.pygame.display.set_mode((self.width, self.height))
         self.pygame.display.set_caption("ArUco Marker Simulation")
 
@@ -29,19 +39,24 @@ class ArUcoSimulation:
                                     random.randint(0, self.height - self.marker_rect.height))
 
         self.clock = self.pygame.time.Clock()
+        self.now = time.time  # Wall clock for ripples and logs, the soak test swaps in a simulated one
+
+        # Fonts and rendered text are made once and reused, not re-created every frame
+        self.fonts = {}
+        self.text_cache = {}
 
         # Ripple effect variables (now used for color change)
         self.ripple_active = False
         self.ripple_start_time = 0
         self.ripple_duration = 1  # seconds
         self.ripple_interval = 3  # seconds between ripples
-        self.next_ripple_time = time.time() + self.ripple_interval
+        self.next_ripple_time = self.now() + self.ripple_interval
 
         self.ripple_count = 0
         self.user_looking_at_screen = False
 
         # Countdown variables
-        self.countdown_start_time = time.time()
+        self.countdown_start_time = self.now()
         self.countdown_duration = 3  # seconds
         self.countdown_active = True
         self.delay_after_countdown = 3  # seconds
@@ -56,6 +71,7 @@ class ArUcoSimulation:
         # Flag to control main loop
         self.running = True
         self.client_socket = None
+        self.socket_address = ('localhost', 65432)  # Event consumer that receives ripple results and metrics
 
         # Initialize the grid parameters
         self.grid_size = 100  # Size of each grid cell (adjust as needed)
@@ -68,9 +84,50 @@ class ArUcoSimulation:
         self.completed = False
         self.vertical_movement = 0  # Counter to track vertical movement
 
+        # Optional precomputed coverage path (path_planner.PlannedPath) replacing the fixed raster
+        self.planned_positions = planned_path.positions() if planned_path is not None else None
+        self.plan_index = 0
+        if self.planned_positions is not None:
+            self.current_x, self.current_y = (int(round(v)) for v in self.planned_positions[0])
+
+        # Optional frame_sync.FrameCodePatch drawn in the corner, carrying frame_count
+        self.sync_patch = sync_patch
+
+        # Optional record of what was shown, for offline alignment with gaze data
+        self.frame_count = 0
+        self.recorder = None
+        self.session_dir = session_dir
+        self.store_dir = store_dir  # Ingest the recorded session into this SessionStore when the run ends
+        if session_dir:
+            self.recorder = SessionRecorder(session_dir, config={
+                "script": "aruco_sim_horizontal.py",
+                "marker_id": marker_id, "marker_size": marker_size,
+                "speed_x": speed_x, "speed_y": speed_y,
+                "width": self.width, "height": self.height, "grid_size": self.grid_size,
+                "ripple_duration": self.ripple_duration, "ripple_interval": self.ripple_interval,
+            })
+
+        # Online quality metrics, shown to the operator with W and optionally sent over the socket
+        self.metrics = SessionMetrics(self.width, self.height, marker_size)
+        self.metrics_channel = metrics_channel
+        self.show_metrics = False
+        self.overlay_font = None
+        self.overlay_surfaces = []
+        self.extend_session = False  # Restart the path instead of exiting when it completes
+
+        # Optional resource_monitor.ResourceMonitor, sampled once per frame
+        self.monitor = monitor
+        if monitor:
+            monitor.track("text_surfaces", lambda: len(self.text_cache) + len(self.overlay_surfaces))
+
     def connect_socket(self):
-        self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.client_socket.connect(('localhost', 65432))
+        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            client_socket.connect(self.socket_address)
+        except OSError:
+            client_socket.close()
+            raise
+        self.client_socket = client_socket
 
     def send_message(self, message):
         try:
@@ -79,6 +136,9 @@ class ArUcoSimulation:
             self.client_socket.sendall(message.encode())
         except Exception as e:
             print(f"Failed to send message: {e}")
+            # Drop the broken connection so the next message reconnects
+            self.close_socket()
+            self.client_socket = None
 
     def close_socket(self):
         try:
@@ -88,6 +148,10 @@ class ArUcoSimulation:
             print(f"Failed to close socket: {e}")
 
     def move_marker(self):
+        if self.planned_positions is not None:
+            self.move_along_plan()
+            return
+
         # Calculate padded boundaries
         padded_left = self.padding_left
         padded_right = self.width - self.padding_right - self.marker_rect.width
@@ -137,6 +201,23 @@ class ArUcoSimulation:
         # Update marker position
         self.marker_rect.topleft = (self.current_x, self.current_y)
 
+    def move_along_plan(self):
+        # One precomputed position per frame, the planner already respects the speed limits
+        self.plan_index = min(self.plan_index + 1, len(self.planned_positions) - 1)
+        x, y = self.planned_positions[self.plan_index]
+        self.current_x, self.current_y = int(round(x)), int(round(y))
+        self.completed = self.plan_index == len(self.planned_positions) - 1
+        self.marker_rect.topleft = (self.current_x, self.current_y)
+
+    def restart_path(self):
+        self.plan_index = 0
+        self.current_x = self.padding_left
+        self.current_y = self.padding_top
+        self.direction_x = 1
+        self.direction_y = 0
+        self.vertical_movement = 0
+        self.completed = False
+
     def pause(self):
         self.paused = True
 
@@ -144,7 +225,7 @@ class ArUcoSimulation:
         self.paused = False
 
     def draw_color_change(self):
-        elapsed_time = time.time() - self.ripple_start_time
+        elapsed_time = self.now() - self.ripple_start_time
         if elapsed_time > self.ripple_duration:
             self.ripple_active = False
             self.log_ripple_event()
@@ -160,122 +241,246 @@ class ArUcoSimulation:
         self.ripple_count += 1
         status = "LOOKING" if self.user_looking_at_screen else "NOT LOOKING"
         print(f"Ripple {self.ripple_count}: User is {status}")
+        self.metrics.ripple_finished(self.user_looking_at_screen)
+        for warning in self.metrics.warnings():
+            print(f"Quality warning: {warning}")
+        if self.metrics_channel:
+            self.send_message(self.metrics.to_message())
+        if self.recorder:
+            self.recorder.record_event(self.now(), self.ripple_count, "result", status)
         # self.send_message(f"User is {status}")
         self.user_looking_at_screen = False
 
     def handle_key_press(self, key):
         if key == self.pygame.K_q:
-            print("Q key pressed")
-            # Handle Q key action
+            print("Session aborted by operator")
+            self.running = False
 
         elif key == self.pygame.K_w:
-            print("W key pressed")
-            # Handle W key action
+            self.show_metrics = not self.show_metrics  # Toggle the operator overlay
 
         elif key == self.pygame.K_e:
-            print("E key pressed")
-            # Handle E key action
+            self.extend_session = not self.extend_session
+            print("Session will be extended" if self.extend_session else "Session will end after this path")
 
     def handle_mouse_button_down(self, button):
         if button == self.pygame.BUTTON_LEFT:
             if self.ripple_active:
                 self.user_looking_at_screen = True
+                now = self.now()
+                reaction = self.metrics.response(now)
+                if reaction is not None and self.recorder:
+                    self.recorder.record_event(now, self.ripple_count + 1, "response", f"{reaction:.3f}")
 
         elif button == self.pygame.BUTTON_RIGHT:
-            self.running = False  # Stop the main loop
-            pygame.quit()  # Quit pygame
+            self.running = False  # Stop the main loop, run() shuts pygame down after saving the session
+
+    def font(self, size):
+        if size not in self.fonts:
+            self.fonts[size] = self.pygame.font.SysFont(None, size)
+        return self.fonts[size]
+
+    def text_surface(self, text, size, color):
+        # Only a handful of distinct strings are ever shown, so the cache stays small
+        key = (text, size, color)
+        if key not in self.text_cache:
+            self.text_cache[key] = self.font(size).render(text, True, color)
+        return self.text_cache[key]
+
+    def draw_metrics_overlay(self):
+        if self.overlay_font is None:
+            self.overlay_font = self.font(36)
+        # Re-render the text twice a second, not every frame
+        if not self.overlay_surfaces or self.frame_count % 15 == 0:
+            self.overlay_surfaces = [
+                self.overlay_font.render(line, True, (255, 0, 0) if line.startswith("WARNING") else (0, 0, 0))
+                for line in self.metrics.overlay_lines()
+            ]
+        y = 10
+        for surface in self.overlay_surfaces:
+            self.window.blit(surface, (10, y))
+            y += surface.get_height() + 4
+
+    def draw_frame(self, countdown_time_left=None):
+        # Compose one frame on the window surface (no flip, so it also works headless)
+        self.window.fill((255, 255, 255))
+        self.window.blit(self.marker_image, self.marker_rect.topleft)
+        center_x = self.marker_rect.centerx
+        center_y = self.marker_rect.centery
+        self.draw.circle(self.window, (255, 0, 0), (center_x, center_y), 10)
 
-    def run(self):
-        running = True
-        recording_active = True
+        if self.ripple_active:
+            self.draw_color_change()
 
-        while running:
-            current_time = time.time()
-
-            # Check if countdown is active
-            if self.countdown_active:
-                elapsed_time = current_time - self.countdown_start_time
-                countdown_time_left = self.countdown_duration - int(elapsed_time)
-                if countdown_time_left <= 0:
-                    self.countdown_active = False
-                    self.delay_start_time = current_time
-                    print("Recording has started")
-
-            # Handle delay after countdown
-            if not self.countdown_active and self.delay_start_time:
-                if current_time - self.delay_start_time < self.delay_after_countdown:
-                    delay_time_left = self.delay_after_countdown - (current_time - self.delay_start_time)
-                    font = self.pygame.font.SysFont(None, 50)
-                    text = font.render(f"Starting in {int(delay_time_left)} seconds...", True, (0, 0, 0))
-                    text_rect = text.get_rect(center=(self.width // 2, self.height // 2))
-                    self.window.blit(text, text_rect)
-                else:
-                    self.delay_start_time = None  # Clear delay start time to indicate delay is over
-
-            if not self.countdown_active and not self.delay_start_time:
-                if current_time > self.next_ripple_time:
-                    self.ripple_active = True
-                    self.ripple_start_time = current_time
-                    self.next_ripple_time = current_time + self.ripple_interval
-
-            for event in self.pygame.event.get():
-                if event.type == self.pygame.QUIT:
-                    running = False
-                elif event.type == self.pygame.KEYDOWN:
-                    if event.key == self.pygame.K_ESCAPE:
-                        running = False
+        if self.paused:
+            text = self.text_surface("Paused - Press 'Space' to Resume", 50, (255, 0, 0))
+            text_rect = text.get_rect(center=(self.width // 2, self.height // 2 - 500))
+            self.window.blit(text, text_rect)
 
-                    elif event.key in [self.pygame.K_q, self.pygame.K_w, self.pygame.K_e]:
-                        self.handle_key_press(event.key)
-                    elif event.key == self.pygame.K_SPACE:
-                        if self.paused:
-                            self.resume()
-                        else:
-                            self.pause()
-
-                elif event.type == self.pygame.MOUSEBUTTONDOWN:
-                    if recording_active:
-                        self.handle_mouse_button_down(event.button)
-
-                    elif event.button == self.pygame.BUTTON_MIDDLE:
-                        print("Middle mouse button pressed")
-                    elif event.button == self.pygame.BUTTON_RIGHT:
-                        self.pygame.quit()  # Quit pygame
-                        exit()  # Exit the program
-
-            if recording_active and not self.paused:
-                self.move_marker()
-                if self.completed:
-                    print("Marker has completed its path. Exiting...")
-                    time.sleep(5)  # Pause for 5 seconds
-                    running = False  # Exit the main loop
-
-            self.window.fill((255, 255, 255))
-            self.window.blit(self.marker_image, self.marker_rect.topleft)
-            center_x = self.marker_rect.centerx
-            center_y = self.marker_rect.centery
-            self.draw.circle(self.window, (255, 0, 0), (center_x, center_y), 10)
+        if countdown_time_left is not None:
+            text = self.text_surface(f"Recording starts in {countdown_time_left}", 100, (0, 0, 0))
+            text_rect = text.get_rect(center=(self.width // 2, self.height // 2))
+            self.window.blit(text, text_rect)
 
-            if self.ripple_active:
-                self.draw_color_change()
+        if self.show_metrics:
+            self.draw_metrics_overlay()
 
-            if self.paused:
-                font = self.pygame.font.SysFont(None, 50)
-                text = font.render("Paused - Press 'Space' to Resume", True, (255, 0, 0))
-                text_rect = text.get_rect(center=(self.width // 2, self.height // 2 - 500))
-                self.window.blit(text, text_rect)
+        if self.sync_patch:
+            self.sync_patch.draw(self.window, self.frame_count)
+
+    def step(self, current_time, recording_active=True, draw=True):
+        """ Everything one frame does apart from input and frame pacing; False once the session is over """
+        running = True
 
-            if self.countdown_active:
-                font = self.pygame.font.SysFont(None, 100)
-                text = font.render(f"Recording starts in {countdown_time_left}", True, (0, 0, 0))
+        # Check if countdown is active
+        countdown_time_left = None
+        if self.countdown_active:
+            elapsed_time = current_time - self.countdown_start_time
+            countdown_time_left = self.countdown_duration - int(elapsed_time)
+            if countdown_time_left <= 0:
+                self.countdown_active = False
+                self.delay_start_time = current_time
+                print("Recording has started")
+
+        # Handle delay after countdown
+        if not self.countdown_active and self.delay_start_time:
+            if current_time - self.delay_start_time < self.delay_after_countdown:
+                delay_time_left = self.delay_after_countdown - (current_time - self.delay_start_time)
+                text = self.text_surface(f"Starting in {int(delay_time_left)} seconds...", 50, (0, 0, 0))
                 text_rect = text.get_rect(center=(self.width // 2, self.height // 2))
                 self.window.blit(text, text_rect)
-
+            else:
+                self.delay_start_time = None  # Clear delay start time to indicate delay is over
+
+        if not self.countdown_active and not self.delay_start_time:
+            if current_time > self.next_ripple_time:
+                self.ripple_active = True
+                self.ripple_start_time = current_time
+                self.next_ripple_time = current_time + self.ripple_interval
+                self.metrics.ripple_started(current_time)
+                if self.recorder:
+                    self.recorder.record_event(current_time, self.ripple_count + 1, "onset")
+
+        if recording_active and not self.paused:
+            self.move_marker()
+            if self.completed and self.extend_session:
+                print("Marker has completed its path. Extending session...")
+                self.restart_path()
+            elif self.completed:
+                print("Marker has completed its path. Exiting...")
+                time.sleep(5)  # Pause for 5 seconds
+                running = False  # Exit the main loop
+
+        self.metrics.frame(current_time, self.marker_rect.x, self.marker_rect.y, self.paused)
+
+        if draw:
+            self.draw_frame(countdown_time_left if self.countdown_active else None)
             self.display.flip()
-            self.clock.tick(30)
+        elif self.ripple_active:
+            self.draw_color_change()  # Still ends the ripple on time when composing is skipped
+
+        if self.recorder:
+            self.recorder.record_frame(self.frame_count, self.now(),
+                                       self.marker_rect.centerx, self.marker_rect.centery)
+        self.frame_count += 1
+        if self.monitor:
+            self.monitor.sample()
+        return running
 
-        self.pygame.quit()
+    def run(self):
+        running = True
+        recording_active = True
 
+        try:
+            while running and self.running:
+                current_time = self.now()
 
-sim = ArUcoSimulation()
-sim.run()
+                for event in self.pygame.event.get():
+                    if event.type == self.pygame.QUIT:
+                        running = False
+                    elif event.type == self.pygame.KEYDOWN:
+                        if event.key == self.pygame.K_ESCAPE:
+                            running = False
+
+                        elif event.key in [self.pygame.K_q, self.pygame.K_w, self.pygame.K_e]:
+                            self.handle_key_press(event.key)
+                        elif event.key == self.pygame.K_SPACE:
+                            if self.paused:
+                                self.resume()
+                            else:
+                                self.pause()
+
+                    elif event.type == self.pygame.MOUSEBUTTONDOWN:
+                        if recording_active:
+                            self.handle_mouse_button_down(event.button)
+
+                        elif event.button == self.pygame.BUTTON_MIDDLE:
+                            print("Middle mouse button pressed")
+                        elif event.button == self.pygame.BUTTON_RIGHT:
+                            self.running = False
+
+                if not self.step(current_time, recording_active):
+                    running = False
+                self.clock.tick(30)
+        finally:
+            # Runs however the loop ends. The window, socket and monitor go first, so a failing
+            # flush or ingest cannot leave the fullscreen window up; the session is stored last
+            if self.monitor:
+                self.monitor.close()
+            self.close_socket()
+            self.pygame.quit()
+            if self.recorder:
+                self.recorder.close()
+                if self.store_dir:
+                    SessionStore(self.store_dir).ingest([self.session_dir])
+
+
+def main(argv=None):
+    from path_planner import parse_region
+    parser = argparse.ArgumentParser(description="Horizontal raster calibration stimulus")
+    parser.add_argument("--marker-id", type=int, default=0)
+    parser.add_argument("--marker-size", type=int, default=300)
+    parser.add_argument("--speed-x", type=int, default=30)
+    parser.add_argument("--speed-y", type=int, default=30)
+    parser.add_argument("--session-dir", help="record trajectory, events and config into this directory")
+    parser.add_argument("--store", help="ingest the recorded session into this SessionStore when the run ends")
+    parser.add_argument("--metrics-channel", action="store_true", help="send METRICS lines over the event socket")
+    parser.add_argument("--planned-path", action="store_true",
+                        help="follow path_planner's shortest coverage path instead of the fixed raster")
+    parser.add_argument("--accel", type=float, help="max acceleration for --planned-path, pixels per frame^2")
+    parser.add_argument("--density", type=float, default=1.0,
+                        help="--planned-path center sweeps per raster row spacing (1 = as close as the fixed raster)")
+    parser.add_argument("--region", type=parse_region, action="append", default=[],
+                        help="x,y,width,height,weight: sweep this screen rectangle weight times denser, may be repeated")
+    parser.add_argument("--sync-patch", choices=("code", "flash"), help="draw a frame_sync patch in the corner")
+    parser.add_argument("--monitor", action="store_true", help="watch memory and handles with resource_monitor")
+    parser.add_argument("--monitor-log", help="CSV for the monitor's snapshots")
+    args = parser.parse_args(argv)
+    if args.store and not args.session_dir:
+        parser.error("--store needs --session-dir")
+    if (args.accel or args.region or args.density != 1.0) and not args.planned_path:
+        parser.error("--accel, --density and --region need --planned-path")
+
+    planned_path = None
+    if args.planned_path:
+        from path_planner import plan_path
+        planned_path = plan_path(WIDTH, HEIGHT, args.marker_size, max(args.speed_x, args.speed_y), args.accel,
+                                 density=args.density, regions=args.region)
+    sync_patch = None
+    if args.sync_patch:
+        from frame_sync import FrameCodePatch
+        sync_patch = FrameCodePatch(WIDTH, HEIGHT, mode=args.sync_patch)
+    monitor = None
+    if args.monitor or args.monitor_log:
+        from resource_monitor import ResourceMonitor
+        monitor = ResourceMonitor(log_path=args.monitor_log)
+
+    sim = ArUcoSimulation(args.marker_id, args.marker_size, args.speed_x, args.speed_y,
+                          session_dir=args.session_dir, metrics_channel=args.metrics_channel,
+                          planned_path=planned_path, sync_patch=sync_patch, store_dir=args.store, monitor=monitor)
+    sim.run()
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,13 @@
+import argparse
 import pygame
 import random
 import cv2
 import time
 
+from marker_cache import ShiftedMarkerCache
+
 class ArUcoSimulation:
-    def __init__(self, marker_id=0, marker_size=350, speed_x=1, speed_y=1):
+    def __init__(self, marker_id=0, marker_size=350, speed_x=1, speed_y=1, subpixel=False, subpixel_steps=8):
         # Initialize Pygame
         pygame.init()
 
@@ -41,7 +44,20 @@ class ArUcoSimulation:
         # Padding from edges
         self.padding = 30
 
+        # Sub-pixel mode keeps the position in float and draws from pre-shifted marker surfaces,
+        # so speeds below a few pixels per frame move smoothly instead of in one-pixel jumps
+        self.subpixel = subpixel
+        self.marker_size = marker_size
+        if self.subpixel:
+            self.marker_cache = ShiftedMarkerCache(marker_id, steps=subpixel_steps)
+            self.position_x = float(self.marker_rect.x)
+            self.position_y = float(self.marker_rect.y)
+
     def move_marker(self):
+        if self.subpixel:
+            self.move_marker_subpixel()
+            return
+
         # Update marker position
         self.marker_rect.x += self.speed_x
         self.marker_rect.y += self.speed_y
@@ -52,6 +68,33 @@ class ArUcoSimulation:
         if self.marker_rect.top <= self.padding or self.marker_rect.bottom >= self.height - self.padding:
             self.speed_y = -self.speed_y
 
+    def move_marker_subpixel(self):
+        self.position_x += self.speed_x
+        self.position_y += self.speed_y
+
+        # Same bounce rule as move_marker, on the float position
+        if self.position_x <= self.padding or self.position_x + self.marker_size >= self.width - self.padding:
+            self.speed_x = -self.speed_x
+        if self.position_y <= self.padding or self.position_y + self.marker_size >= self.height - self.padding:
+            self.speed_y = -self.speed_y
+
+        # Keep the rect in step for anything that reads the integer position
+        self.marker_rect.topleft = (int(round(self.position_x)), int(round(self.position_y)))
+
+    def draw_frame(self):
+        # Clear the screen
+        self.window.fill((255, 255, 255))
+
+        # Draw marker and center red dot
+        if self.subpixel:
+            marker_surface, left, top = self.marker_cache.lookup(self.position_x, self.position_y, self.marker_size)
+            self.window.blit(marker_surface, (left, top))
+            center_position = (self.position_x + self.marker_size / 2, self.position_y + self.marker_size / 2)
+        else:
+            self.window.blit(self.marker_image, self.marker_rect)
+            center_position = self.marker_rect.center
+        pygame.draw.circle(self.window, (255, 0, 0), center_position, 10)
+
     def run(self):
         running = True
 
@@ -66,19 +109,33 @@ class ArUcoSimulation:
 
             self.move_marker()
 
-            # Clear the screen
-            self.window.fill((255, 255, 255))
-
-            # Draw marker and center red dot
-            self.window.blit(self.marker_image, self.marker_rect)
-            center_position = self.marker_rect.center
-            pygame.draw.circle(self.window, (255, 0, 0), center_position, 10)
+            self.draw_frame()
 
             # Update the display
             pygame.display.flip()
 
         pygame.quit()
 
-if __name__ == "__main__":
-    simulation = ArUcoSimulation(speed_x=2, speed_y=2)  # Adjust speed values
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bouncing marker stimulus")
+    parser.add_argument("--marker-id", type=int, default=0)
+    parser.add_argument("--marker-size", type=int, default=350)
+    parser.add_argument("--speed-x", type=float, default=2)
+    parser.add_argument("--speed-y", type=float, default=2)
+    parser.add_argument("--subpixel", action="store_true", help="float positions drawn from pre-shifted markers")
+    parser.add_argument("--subpixel-steps", type=int, default=8, help="fractional offsets per pixel")
+    args = parser.parse_args(argv)
+    if not args.subpixel and (args.speed_x != int(args.speed_x) or args.speed_y != int(args.speed_y)):
+        parser.error("fractional speeds need --subpixel")
+
+    speed_x, speed_y = args.speed_x, args.speed_y
+    if not args.subpixel:
+        speed_x, speed_y = int(speed_x), int(speed_y)  # The Rect path only moves in whole pixels
+    simulation = ArUcoSimulation(args.marker_id, args.marker_size, speed_x, speed_y,
+                                 subpixel=args.subpixel, subpixel_steps=args.subpixel_steps)
     simulation.run()
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import headless
+
+BACKENDS = ["pygame", "pyglet", "kivy"]
+RESOLUTIONS = [(1920, 1080), (3440, 1440)]
+MARKER_COUNTS = [1, 4, 16]
+MARKER_SIZE = 200
+WARMUP_FRAMES = 30
+
+
+def scene_positions(frame, count, width, height, marker_size=MARKER_SIZE):
+    # Identical scripted scene for every backend: each marker bounces inside the
+    # window with its own speed, written in closed form so no state is carried
+    positions = []
+    span_x = width - marker_size
+    span_y = height - marker_size
+    for index in range(count):
+        travel_x = frame * (3 + index % 5) + index * 97
+        travel_y = frame * (2 + index % 3) + index * 61
+        x = travel_x % (2 * span_x)
+        y = travel_y % (2 * span_y)
+        positions.append((x if x <= span_x else 2 * span_x - x,
+                          y if y <= span_y else 2 * span_y - y))
+    return positions
+
+
+def marker_rgb(marker_id, marker_size=MARKER_SIZE):
+    import cv2
+    aruco_dict = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50)
+    marker_image = cv2.aruco.generateImageMarker(aruco_dict, marker_id % 50, marker_size)
+    return cv2.cvtColor(marker_image, cv2.COLOR_GRAY2RGB)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(frame_times, wall_time, cpu_time):
+    # frame_times are seconds per frame after warm-up
+    ordered = sorted(frame_times)
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return {
+        "frames": len(frame_times),
+        "fps": len(frame_times) / wall_time if wall_time else 0.0,
+        "frame_ms_p50": percentile(ordered, 0.50) * 1000,
+        "frame_ms_p95": percentile(ordered, 0.95) * 1000,
+        "frame_ms_p99": percentile(ordered, 0.99) * 1000,
+        "frame_ms_max": (ordered[-1] if ordered else 0.0) * 1000,
+        "cpu_percent": 100.0 * cpu_time / wall_time if wall_time else 0.0,
+        "max_rss_mb": usage.ru_maxrss / 1024.0,  # ru_maxrss is in kilobytes on Linux
+    }
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+class FrameRecorder:
+    def __init__(self, frames):
+        self.frames = frames
+        self.frame_times = []
+        self.count = 0
+        self.last = None
+        self.start_wall = None
+        self.start_cpu = None
+
+    def tick(self):
+        # Call once per presented frame; returns False once enough frames were recorded
+        now = time.perf_counter()
+        if self.count == WARMUP_FRAMES:
+            self.start_wall = now
+            self.start_cpu = cpu_seconds()
+        elif self.count > WARMUP_FRAMES:
+            self.frame_times.append(now - self.last)
+        self.last = now
+        self.count += 1
+        return self.count <= WARMUP_FRAMES + self.frames
+
+    def result(self):
+        return summarize(self.frame_times, self.last - self.start_wall, cpu_seconds() - self.start_cpu)
+
+
+def run_pygame(width, height, count, frames):
+    import pygame
+    pygame.init()
+    window = pygame.display.set_mode((width, height))
+    markers = [pygame.image.frombuffer(marker_rgb(i).tobytes(), (MARKER_SIZE, MARKER_SIZE), "RGB").convert()
+               for i in range(count)]
+    recorder = FrameRecorder(frames)
+    frame = 0
+    while recorder.tick():
+        pygame.event.pump()
+        window.fill((255, 255, 255))
+        for marker, (x, y) in zip(markers, scene_positions(frame, count, width, height)):
+            window.blit(marker, (x, y))
+            pygame.draw.circle(window, (255, 0, 0), (x + MARKER_SIZE // 2, y + MARKER_SIZE // 2), 10)
+        pygame.display.flip()
+        frame += 1
+    pygame.quit()
+    return recorder.result()
+
+
+def run_pyglet(width, height, count, frames):
+    import pyglet
+    window = pyglet.window.Window(width=width, height=height, vsync=False)
+    batch = pyglet.graphics.Batch()
+    sprites = []
+    dots = []
+    for i in range(count):
+        # pyglet's origin is bottom-left, so flip the marker like new_pyglet_hor.py does
+        data = marker_rgb(i)[::-1].tobytes()
+        image = pyglet.image.ImageData(MARKER_SIZE, MARKER_SIZE, 'RGB', data)
+        sprites.append(pyglet.sprite.Sprite(image, batch=batch))
+        dots.append(pyglet.shapes.Circle(0, 0, 10, color=(255, 0, 0), batch=batch))
+    pyglet.gl.glClearColor(1, 1, 1, 1)
+
+    recorder = FrameRecorder(frames)
+    frame = 0
+    while recorder.tick():
+        window.dispatch_events()
+        for sprite, dot, (x, y) in zip(sprites, dots, scene_positions(frame, count, width, height)):
+            sprite.x, sprite.y = x, y
+            dot.x, dot.y = x + MARKER_SIZE // 2, y + MARKER_SIZE // 2
+        window.clear()
+        batch.draw()
+        pyglet.gl.glFinish()  # Count the GPU work, not just queuing it
+        window.flip()
+        frame += 1
+    window.close()
+    return recorder.result()
+
+
+def run_kivy(width, height, count, frames):
+    from kivy.config import Config
+    Config.set('graphics', 'width', str(width))
+    Config.set('graphics', 'height', str(height))
+    Config.set('graphics', 'vsync', '0')
+    Config.set('graphics', 'maxfps', '0')  # Let the clock run as fast as frames render
+
+    from kivy.app import App
+    from kivy.clock import Clock
+    from kivy.graphics import Color, Ellipse, Rectangle
+    from kivy.graphics.texture import Texture
+    from kivy.uix.widget import Widget
+
+    recorder = FrameRecorder(frames)
+
+    class SceneWidget(Widget):
+        def __init__(self, **kwargs):
+            super(SceneWidget, self).__init__(**kwargs)
+            self.frame = 0
+            self.markers = []
+            self.dots = []
+            with self.canvas:
+                Color(1, 1, 1)
+                Rectangle(pos=(0, 0), size=(width, height))
+                for i in range(count):
+                    texture = Texture.create(size=(MARKER_SIZE, MARKER_SIZE), colorfmt='rgb')
+                    texture.blit_buffer(marker_rgb(i)[::-1].tobytes(), colorfmt='rgb', bufferfmt='ubyte')
+                    Color(1, 1, 1)
+                    self.markers.append(Rectangle(texture=texture, size=(MARKER_SIZE, MARKER_SIZE)))
+                    Color(1, 0, 0)
+                    self.dots.append(Ellipse(size=(20, 20)))
+            Clock.schedule_interval(self.update, 0)
+
+        def update(self, dt):
+            if not recorder.tick():
+                App.get_running_app().stop()
+                return False
+            for marker, dot, (x, y) in zip(self.markers, self.dots,
+                                           scene_positions(self.frame, count, width, height)):
+                marker.pos = (x, y)
+                dot.pos = (x + MARKER_SIZE // 2 - 10, y + MARKER_SIZE // 2 - 10)
+            self.frame += 1
+
+    class SceneApp(App):
+        def build(self):
+            return SceneWidget()
+
+    SceneApp().run()
+    return recorder.result()
+
+
+RUNNERS = {"pygame": run_pygame, "pyglet": run_pyglet, "kivy": run_kivy}
+
+
+def run_worker(backend, width, height, count, frames):
+    result = RUNNERS[backend](width, height, count, frames)
+    result.update({"backend": backend, "width": width, "height": height, "markers": count})
+    # The parent picks this line out of whatever else the backend printed
+    print("RESULT " + json.dumps(result), flush=True)
+
+
+def run_case(backend, width, height, count, frames, timeout):
+    # Every case gets a fresh interpreter so peak memory and CPU time are not shared
+    command = [sys.executable, os.path.abspath(__file__), "--worker", backend,
+               "--width", str(width), "--height", str(height),
+               "--markers", str(count), "--frames", str(frames)]
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        print(f"{backend} {width}x{height} x{count}: timed out after {timeout}s")
+        return None
+    for line in completed.stdout.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    print(f"{backend} {width}x{height} x{count}: failed (exit code {completed.returncode})")
+    if completed.stderr:
+        print(completed.stderr.strip().splitlines()[-1])
+    return None
+
+
+def format_report(results):
+    header = (f"{'backend':8s} {'resolution':>11s} {'markers':>7s} {'fps':>8s} "
+              f"{'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} {'cpu %':>7s} {'rss MB':>8s}")
+    lines = [header, "-" * len(header)]
+    ordered = sorted(results, key=lambda r: (r["width"] * r["height"], r["markers"], -r["fps"]))
+    for r in ordered:
+        lines.append(f"{r['backend']:8s} {r['width']:>5d}x{r['height']:<5d} {r['markers']:>7d} {r['fps']:>8.1f} "
+                     f"{r['frame_ms_p50']:>8.2f} {r['frame_ms_p95']:>8.2f} {r['frame_ms_p99']:>8.2f} "
+                     f"{r['cpu_percent']:>7.1f} {r['max_rss_mb']:>8.1f}")
+
+    # Fastest backend for every resolution / marker count combination
+    lines.append("")
+    cases = sorted({(r["width"], r["height"], r["markers"]) for r in results})
+    for width, height, count in cases:
+        same_case = [r for r in results if (r["width"], r["height"], r["markers"]) == (width, height, count)]
+        best = max(same_case, key=lambda r: r["fps"])
+        lines.append(f"Fastest at {width}x{height} with {count} marker(s): {best['backend']} ({best['fps']:.1f} fps)")
+    return "\n".join(lines)
+
+
+def parse_resolution(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare rendering throughput of the pygame, pyglet and Kivy backends")
+    parser.add_argument("--backends", nargs="*", default=BACKENDS, choices=BACKENDS)
+    parser.add_argument("--resolutions", nargs="*", type=parse_resolution, default=RESOLUTIONS,
+                        help="e.g. 1920x1080 3440x1440")
+    parser.add_argument("--markers", nargs="*", type=int, default=MARKER_COUNTS)
+    parser.add_argument("--frames", type=int, default=600, help="measured frames per case (after warm-up)")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds before a case is abandoned")
+    parser.add_argument("--json", help="also write the raw results to this file")
+    parser.add_argument("--worker", choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument("--width", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--height", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        headless.quiet_kivy()
+        run_worker(args.worker, args.width, args.height, args.markers[0], args.frames)
+        return 0
+
+    largest = max(args.resolutions, key=lambda r: r[0] * r[1])
+    display = headless.start_virtual_display(*largest)
+    results = []
+    try:
+        for backend in args.backends:
+            for width, height in args.resolutions:
+                for count in args.markers:
+                    result = run_case(backend, width, height, count, args.frames, args.timeout)
+                    if result:
+                        print(f"{backend} {width}x{height} x{count}: {result['fps']:.1f} fps")
+                        results.append(result)
+    finally:
+        headless.stop_virtual_display(display)
+
+    if not results:
+        print("No backend produced results")
+        return 1
+
+    print()
+    print(format_report(results))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
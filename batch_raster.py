@@ -0,0 +1,121 @@
+import sys
+import time
+
+import cv2
+import numpy as np
+
+BACKGROUND = 255
+# Luma of the (255, 0, 0) red dot the scripts draw, as cv2.COLOR_RGB2GRAY would give it
+DOT_VALUE = 76
+
+
+def marker_bitmap(marker_id=0, marker_size=300):
+    aruco_dict = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50)
+    return cv2.aruco.generateImageMarker(aruco_dict, marker_id, marker_size)
+
+
+class BatchRasterizer:
+    """ Render the white canvas + marker + red dot scene straight into uint8 arrays, many frames at once """
+
+    def __init__(self, width, height, marker_image, dot_radius=10, downsample=1,
+                 background=BACKGROUND, dot_value=DOT_VALUE, chunk_size=64):
+        self.downsample = downsample
+        self.width = width // downsample
+        self.height = height // downsample
+        self.background = background
+        self.chunk_size = chunk_size  # Frames per scatter, bounds the size of the index arrays
+
+        marker_size = marker_image.shape[0]
+        self.marker_size = marker_size
+        if downsample > 1:
+            # Area averaging keeps the cell edges of the 6x6 grid as clean as the scale allows
+            scaled_size = max(1, marker_size // downsample)
+            marker_image = cv2.resize(marker_image, (scaled_size, scaled_size), interpolation=cv2.INTER_AREA)
+        self.marker = np.ascontiguousarray(marker_image, dtype=np.uint8)
+        marker_h, marker_w = self.marker.shape
+
+        # Flat offsets of every marker pixel relative to the marker's top-left pixel
+        rows, cols = np.mgrid[0:marker_h, 0:marker_w]
+        self.marker_offsets = (rows * self.width + cols).ravel()
+
+        # Same for the pixels inside the dot, relative to the dot center
+        radius = max(1, int(round(dot_radius / downsample)))
+        dy, dx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+        inside = dy * dy + dx * dx <= radius * radius
+        self.dot_offsets = (dy[inside] * self.width + dx[inside]).ravel()
+        self.dot_radius = radius
+        self.dot_value = dot_value
+
+    def allocate(self, count):
+        return np.empty((count, self.height, self.width), dtype=np.uint8)
+
+    def render(self, positions, out=None):
+        """ positions: (N, 2) marker top-left (x, y) in full-resolution screen pixels """
+        positions = np.asarray(positions)
+        count = len(positions)
+        if out is None:
+            out = self.allocate(count)
+        elif out.shape != (count, self.height, self.width) or out.dtype != np.uint8:
+            raise ValueError(f"out must be a uint8 array of shape {(count, self.height, self.width)}")
+        if not out.flags.c_contiguous:
+            raise ValueError("out must be C-contiguous")
+
+        marker_h, marker_w = self.marker.shape
+        # Keep every marker fully on the canvas, the scripts clamp to the padded area the same way
+        x = np.clip(np.rint(positions[:, 0] / self.downsample).astype(np.int64), 0, self.width - marker_w)
+        y = np.clip(np.rint(positions[:, 1] / self.downsample).astype(np.int64), 0, self.height - marker_h)
+        center_x = np.clip(x + marker_w // 2, self.dot_radius, self.width - 1 - self.dot_radius)
+        center_y = np.clip(y + marker_h // 2, self.dot_radius, self.height - 1 - self.dot_radius)
+
+        out.fill(self.background)
+        flat = out.reshape(-1)
+        frame_pixels = self.height * self.width
+        marker_values = self.marker.ravel()
+        for start in range(0, count, self.chunk_size):
+            stop = min(start + self.chunk_size, count)
+            frame_base = np.arange(start, stop, dtype=np.int64) * frame_pixels
+
+            corner = frame_base + y[start:stop] * self.width + x[start:stop]
+            index = corner[:, None] + self.marker_offsets[None, :]
+            flat[index] = np.broadcast_to(marker_values, index.shape)
+
+            center = frame_base + center_y[start:stop] * self.width + center_x[start:stop]
+            flat[center[:, None] + self.dot_offsets[None, :]] = self.dot_value
+        return out
+
+
+def render_frames(positions, width, height, marker_image, downsample=1, out=None):
+    return BatchRasterizer(width, height, marker_image, downsample=downsample).render(positions, out=out)
+
+
+def bounce_positions(count, width, height, marker_size, speed_x=2, speed_y=2, padding=30):
+    """ A bouncing path in closed form, for benchmarks and checks
+
+    Like aruco_sim_light.py it bounces between the padded edges, but it starts at the padding instead of
+    a random point and reflects exactly at the edge, where the script reverses only after the step that
+    crossed it. Use the script's move_marker when the exact live path matters.
+    """
+    span_x = width - 2 * padding - marker_size
+    span_y = height - 2 * padding - marker_size
+    frames = np.arange(count)
+    x = (frames * speed_x) % (2 * span_x)
+    y = (frames * speed_y) % (2 * span_y)
+    x = np.where(x <= span_x, x, 2 * span_x - x) + padding
+    y = np.where(y <= span_y, y, 2 * span_y - y) + padding
+    return np.stack([x, y], axis=1)
+
+
+if __name__ == "__main__":
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    downsample = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    width, height, marker_size = 3440, 1440, 350
+
+    rasterizer = BatchRasterizer(width, height, marker_bitmap(0, marker_size), downsample=downsample)
+    positions = bounce_positions(frames, width, height, marker_size)
+    out = rasterizer.allocate(frames)
+
+    start = time.perf_counter()
+    rasterizer.render(positions, out=out)
+    elapsed = time.perf_counter() - start
+    print(f"Rendered {frames} frames of {rasterizer.width}x{rasterizer.height} in {elapsed:.3f}s "
+          f"({frames / elapsed:.0f} frames/s)")
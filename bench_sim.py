@@ -0,0 +1,275 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+import types
+
+import headless
+
+BASELINE_FILE = "bench_baselines.json"
+DEFAULT_THRESHOLD = 0.25  # Fail when a benchmark gets more than 25% slower
+OPTIONAL_BACKENDS = ("pyglet", "kivy")
+
+# Resolution and marker size of every script, as hard-coded in the scripts themselves
+SCRIPT_SCENES = {
+    "aruco_sim_horizontal": (3440, 1400, 300),
+    "aruco_sim_vertical": (3440, 1400, 300),
+    "aruco_sim_light": (3440, 1440, 350),
+    "new_pyglet_hor": (1920, 1080, 200),
+    "new_pyglet_Ver": (1920, 1080, 200),
+    "pyglet_random_SIM": (1920, 1080, 200),
+}
+
+
+def reset_raster_path(sim, direction_x, direction_y):
+    # Same as the pygame scripts' restart_path(), for the pyglet stand-ins
+    sim.current_x = sim.padding_left
+    sim.current_y = sim.padding_top
+    sim.direction_x = direction_x
+    sim.direction_y = direction_y
+    sim.completed = False
+    if hasattr(sim, "vertical_movement"):
+        sim.vertical_movement = 0
+    if hasattr(sim, "horizontal_movement"):
+        sim.horizontal_movement = 0
+
+
+def pygame_raster_step(module_name):
+    module = __import__(module_name)
+    sim = module.ArUcoSimulation()
+
+    def step():
+        sim.move_marker()
+        if sim.completed:
+            sim.restart_path()
+
+    return step
+
+
+def pygame_light_step(subpixel=False):
+    import aruco_sim_light
+    sim = aruco_sim_light.ArUcoSimulation(speed_x=2, speed_y=2, subpixel=subpixel)
+    return sim.move_marker
+
+
+def pygame_light_subpixel_compose_step():
+    # Slow float motion so the cache cycles through its fractional offsets while timing
+    import aruco_sim_light
+    sim = aruco_sim_light.ArUcoSimulation(speed_x=0.3, speed_y=0.2, subpixel=True)
+
+    def step():
+        sim.move_marker()
+        sim.draw_frame()
+
+    return step
+
+
+def pyglet_update_step(module_name, class_name, direction_x, direction_y):
+    import pyglet
+    pyglet.options["shadow_window"] = False
+    if not os.environ.get("DISPLAY"):
+        pyglet.options["headless"] = True
+    module = __import__(module_name)
+    update = getattr(module, class_name).update
+
+    # update() only touches plain attributes, so it runs against a stand-in instead of a real window
+    width, height, marker_size = SCRIPT_SCENES[module_name]
+    sim = types.SimpleNamespace(
+        width=width, height=height, paused=False, grid_size=100,
+        padding_left=30, padding_right=50, padding_top=50, padding_bottom=30,
+        speed_x=3, speed_y=3,
+        marker_sprite=types.SimpleNamespace(x=0, y=0, width=marker_size, height=marker_size),
+    )
+    if direction_x:
+        sim.vertical_movement = 0
+    else:
+        sim.horizontal_movement = 0
+    reset_raster_path(sim, direction_x, direction_y)
+
+    def step():
+        update(sim, 1 / 60.0)
+        if sim.completed:
+            reset_raster_path(sim, direction_x, direction_y)
+
+    return step
+
+
+def kivy_update_step():
+    import pyglet_random_SIM
+    simulation_class = pyglet_random_SIM.ArUcoSimulation
+
+    width, height, marker_size = SCRIPT_SCENES["pyglet_random_SIM"]
+    sim = types.SimpleNamespace(
+        width=width, height=height, marker_size=marker_size, dot_size=20,
+        speed_x=1, speed_y=1, padding=40, x=width // 3, y=height // 3, paused=False,
+        marker=types.SimpleNamespace(pos=(0, 0)), dot=types.SimpleNamespace(pos=(0, 0)),
+    )
+    sim.calculate_dot_position = lambda: simulation_class.calculate_dot_position(sim)
+
+    def step():
+        simulation_class.update(sim, 1 / 60.0)
+
+    return step
+
+
+def marker_generation_step(marker_size):
+    import cv2
+    aruco_dict = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50)
+
+    def step():
+        cv2.aruco.generateImageMarker(aruco_dict, 0, marker_size)
+
+    return step
+
+
+def pygame_compose_step(module_name):
+    # Draw through the script's own draw_frame() on the dummy SDL display
+    module = __import__(module_name)
+    sim = module.ArUcoSimulation()
+    return sim.draw_frame
+
+
+def offscreen_compose_step(module_name):
+    # The GL scripts need a context to draw, so this times pygame blitting the same
+    # scene at their resolution: a size-for-size reference, not their GL pipelines
+    import cv2
+    import pygame
+    width, height, marker_size = SCRIPT_SCENES[module_name]
+    aruco_dict = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50)
+    marker_image = cv2.cvtColor(cv2.aruco.generateImageMarker(aruco_dict, 0, marker_size), cv2.COLOR_GRAY2RGB)
+    marker_surface = pygame.image.frombuffer(marker_image.tobytes(), (marker_size, marker_size), "RGB")
+    frame = pygame.Surface((width, height))
+    position = ((width - marker_size) // 2, (height - marker_size) // 2)
+    center = (position[0] + marker_size // 2, position[1] + marker_size // 2)
+
+    def step():
+        frame.fill((255, 255, 255))
+        frame.blit(marker_surface, position)
+        pygame.draw.circle(frame, (255, 0, 0), center, 10)
+
+    return step
+
+
+# name -> (factory, calls per timing run)
+BENCHMARKS = {
+    "move_marker_horizontal": (lambda: pygame_raster_step("aruco_sim_horizontal"), 20000),
+    "move_marker_vertical": (lambda: pygame_raster_step("aruco_sim_vertical"), 20000),
+    "move_marker_light": (pygame_light_step, 20000),
+    "move_marker_light_subpixel": (lambda: pygame_light_step(subpixel=True), 20000),
+    "pyglet_update_hor": (lambda: pyglet_update_step("new_pyglet_hor", "ArUcoSimulation", 1, 0), 20000),
+    "pyglet_update_ver": (lambda: pyglet_update_step("new_pyglet_Ver", "ArUcoVerticalSimulation", 0, 1), 20000),
+    "kivy_update_bounce": (kivy_update_step, 20000),
+    "marker_generation_200": (lambda: marker_generation_step(200), 200),
+    "marker_generation_300": (lambda: marker_generation_step(300), 200),
+    "marker_generation_350": (lambda: marker_generation_step(350), 200),
+    "compose_aruco_sim_horizontal": (lambda: pygame_compose_step("aruco_sim_horizontal"), 50),
+    "compose_aruco_sim_vertical": (lambda: pygame_compose_step("aruco_sim_vertical"), 50),
+    "compose_aruco_sim_light": (lambda: pygame_compose_step("aruco_sim_light"), 50),
+    "compose_aruco_sim_light_subpixel": (pygame_light_subpixel_compose_step, 50),
+    "pygame_blit_pyglet_scene": (lambda: offscreen_compose_step("new_pyglet_hor"), 50),
+    "pygame_blit_kivy_scene": (lambda: offscreen_compose_step("pyglet_random_SIM"), 50),
+}
+
+
+def run_benchmarks(names, repeat):
+    results = {}
+    for name in names:
+        factory, number = BENCHMARKS[name]
+        try:
+            step = factory()
+        except ImportError as e:
+            # pyglet and Kivy are optional, their benchmarks only run where they are installed.
+            # Any other import failure is a broken module under test and must not pass as a skip
+            if (e.name or "").split(".")[0] not in OPTIONAL_BACKENDS:
+                raise
+            print(f"{name:32s} skipped ({e})")
+            continue
+        step()  # Warm up caches and lazy imports outside the timed runs
+        # Best of several runs is the least noisy estimate of the real cost
+        per_call = min(timeit.repeat(step, number=number, repeat=repeat)) / number
+        results[name] = {"per_call_us": per_call * 1e6, "calls_per_s": 1.0 / per_call}
+        print(f"{name:32s} {per_call * 1e6:12.3f} us/call {1.0 / per_call:14.1f} calls/s")
+    return results
+
+
+def load_baselines(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baselines(path, results):
+    data = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    print(f"Saved baselines for {len(results)} benchmarks to {path}")
+
+
+def compare(results, baselines, threshold, names):
+    regressions = []
+    for name in names:
+        # A benchmark that has a baseline but did not run here cannot be shown to be fine
+        if name in baselines["results"] and name not in results:
+            print(f"{name:32s} no result, baseline exists  MISSING")
+            regressions.append(name)
+    for name, result in results.items():
+        baseline = baselines["results"].get(name)
+        if baseline is None:
+            print(f"{name:32s} no baseline")
+            continue
+        ratio = result["per_call_us"] / baseline["per_call_us"]
+        status = "REGRESSION" if ratio > 1 + threshold else "ok"
+        print(f"{name:32s} {ratio:6.2f}x baseline  {status}")
+        if status != "ok":
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the simulation hot paths")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline JSON file")
+    parser.add_argument("--save", action="store_true", help="store the results as the new baselines")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown before failing, as a fraction (default 0.25)")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs per benchmark")
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS), help="run a subset")
+    args = parser.parse_args(argv)
+
+    baseline_path = os.path.abspath(args.baseline)
+    # The scripts are imported by name after we move into a scratch directory
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    headless.use_offscreen_pygame()
+    headless.quiet_kivy()
+
+    names = args.only or list(BENCHMARKS)
+    with headless.marker_workdir():
+        results = run_benchmarks(names, args.repeat)
+
+    if args.save:
+        save_baselines(baseline_path, results)
+        return 0
+
+    baselines = load_baselines(baseline_path)
+    if baselines is None:
+        # Without baselines nothing can regress, so do not let a missing file pass silently
+        print(f"No baselines at {baseline_path}: run with --save on this machine first, then compare")
+        return 2
+
+    regressions = compare(results, baselines, args.threshold, names)
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) missing or regressed by more than {args.threshold:.0%}: "
+              f"{', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
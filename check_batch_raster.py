@@ -0,0 +1,82 @@
+import argparse
+import sys
+
+import cv2
+import numpy as np
+
+import batch_raster
+import headless
+
+
+def detect_center(gray, detector):
+    corners, ids, _ = detector.detectMarkers(gray)
+    if ids is None or 0 not in ids.ravel():
+        return None
+    return corners[list(ids.ravel()).index(0)][0].mean(axis=0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check BatchRasterizer frames against the pygame composition they replace")
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument("--every", type=int, default=5, help="compare one frame in this many")
+    parser.add_argument("--downsample", type=int, default=4, help="also check a downsampled rasterizer")
+    args = parser.parse_args(argv)
+
+    headless.use_offscreen_pygame()
+    import pygame
+    import aruco_sim_light
+
+    detector = cv2.aruco.ArucoDetector(cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50),
+                                       cv2.aruco.DetectorParameters())
+    problems = []
+    checked = 0
+    worst_shift = 0.0
+    with headless.marker_workdir():
+        sim = aruco_sim_light.ArUcoSimulation()
+        bitmap = batch_raster.marker_bitmap(0, sim.marker_size)
+        full = batch_raster.BatchRasterizer(sim.width, sim.height, bitmap)
+        scaled = batch_raster.BatchRasterizer(sim.width, sim.height, bitmap, downsample=args.downsample)
+        # Odd speeds so the compared frames land on varied positions
+        positions = batch_raster.bounce_positions(args.frames, sim.width, sim.height, sim.marker_size, 37, 23)
+        frames = full.render(positions)
+        scaled_frames = scaled.render(positions)
+
+        for index in range(0, args.frames, args.every):
+            sim.marker_rect.topleft = tuple(int(value) for value in positions[index])
+            sim.draw_frame()
+            # surfarray is (width, height, 3), the arrays are rows first
+            rgb = np.ascontiguousarray(pygame.surfarray.array3d(sim.window).swapaxes(0, 1))
+            gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+            checked += 1
+
+            # Full resolution: identical except where pygame's circle rim and the disk mask disagree
+            ys, xs = np.nonzero(gray != frames[index])
+            center_x, center_y = sim.marker_rect.center
+            off_rim = np.abs(np.hypot(xs - center_x, ys - center_y) - 10) > 1
+            if off_rim.any():
+                problems.append(f"frame {index}: {int(off_rim.sum())} pixels differ away from the dot's rim")
+
+            # Downsampled: the marker lands within a pixel of an area-scaled capture of the real frame
+            expected = detect_center(cv2.resize(gray, (scaled.width, scaled.height), interpolation=cv2.INTER_AREA),
+                                     detector)
+            found = detect_center(scaled_frames[index], detector)
+            if expected is None or found is None:
+                problems.append(f"frame {index}: marker not detected at 1/{args.downsample} scale")
+                continue
+            shift = float(np.hypot(*(found - expected)))
+            worst_shift = max(worst_shift, shift)
+            if shift > 1:
+                problems.append(f"frame {index}: center {shift:.2f} px off at 1/{args.downsample} scale")
+        pygame.quit()
+
+    print(f"{checked} frames compared, worst center shift at 1/{args.downsample} scale {worst_shift:.2f} px")
+    for problem in problems:
+        print("FAILED: " + problem)
+    if problems:
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+import argparse
+import sys
+
+import cv2
+import numpy as np
+
+import frame_sync
+import headless
+
+
+def display_schedule(count, drops, repeats):
+    """ Frame id on screen at every refresh: ids in drops never appear, ids in repeats stay up for two refreshes """
+    shown = []
+    for frame_id in range(count):
+        if frame_id in drops:
+            continue
+        shown.append(frame_id)
+        if frame_id in repeats:
+            shown.append(frame_id)
+    return shown
+
+
+def photodiode_trace(levels, schedule, fps, latency, rate, rise, noise, seed=0):
+    """ Photodiode reading of the flash patch at rate samples/s: black before the first refresh, a first-order
+    rise with time constant rise toward every refresh's level, plus Gaussian noise """
+    rng = np.random.default_rng(seed)
+    times = np.arange(0.0, (len(schedule) + 2) / fps + latency, 1.0 / rate)
+    refresh = np.floor((times - latency) * fps).astype(np.int64)
+    shown = np.array(schedule)[np.clip(refresh, 0, len(schedule) - 1)]
+    target = np.where(refresh >= 0, levels[shown], 0.0)
+    smoothing = 1 - np.exp(-1.0 / (rate * rise))
+    values = np.empty_like(target)
+    value = 0.0
+    for index, level in enumerate(target):
+        value += (level - value) * smoothing
+        values[index] = value
+    return times, values + rng.normal(0, noise, len(values))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Round-trip check of the frame-code and flash patches through rendering, capture and decoding")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--latency", type=float, default=0.045, help="injected display latency in seconds")
+    parser.add_argument("--capture-width", type=int, default=1720, help="the camera's horizontal resolution")
+    parser.add_argument("--start-id", type=int, default=(1 << 20) - 300,
+                        help="first frame id, close to the top so the counter wraps during the check")
+    parser.add_argument("--trace-rate", type=float, default=2000, help="photodiode samples per second")
+    parser.add_argument("--rise", type=float, default=0.0015, help="photodiode and panel rise time constant, seconds")
+    args = parser.parse_args(argv)
+
+    # Like a late frame under vsync: the previous frame is held for a refresh, and a few frames
+    # later one is skipped to catch up, so the display is never ahead of the sim
+    rng = np.random.default_rng(0)
+    repeats = set(int(i) for i in np.sort(rng.choice(np.arange(10, args.frames - 60, 60), 8, replace=False)))
+    drops = set(repeat + int(rng.integers(1, 30)) for repeat in repeats)
+    schedule = display_schedule(args.frames, drops, repeats)
+
+    headless.use_offscreen_pygame()
+    import pygame
+    import aruco_sim_horizontal
+
+    with headless.marker_workdir():
+        sim = aruco_sim_horizontal.ArUcoSimulation()
+        patch = frame_sync.FrameCodePatch(sim.width, sim.height)
+        flash = frame_sync.FrameCodePatch(sim.width, sim.height, mode="flash")
+        capture_height = round(args.capture_width * sim.height / sim.width)
+
+        # Render every frame through the sim's own draw_frame with each patch: keep the scaled-down
+        # capture of the code patch and the mean brightness under the flash patch, what a photodiode sees
+        captures = {}
+        flash_x, flash_y, flash_w, flash_h = flash.rects[0]
+        flash_levels = np.empty(args.frames)
+        for frame_id in range(args.frames):
+            sim.frame_count = args.start_id + frame_id
+            sim.move_marker()
+            sim.sync_patch = patch
+            sim.draw_frame()
+            frame = pygame.surfarray.array3d(sim.window).swapaxes(0, 1)
+            gray = cv2.cvtColor(np.ascontiguousarray(frame), cv2.COLOR_RGB2GRAY)
+            captures[frame_id] = cv2.resize(gray, (args.capture_width, capture_height), interpolation=cv2.INTER_AREA)
+            sim.sync_patch = flash
+            sim.draw_frame()
+            under = pygame.surfarray.pixels3d(sim.window)[flash_x:flash_x + flash_w, flash_y:flash_y + flash_h]
+            flash_levels[frame_id] = under.mean()
+            del under  # pixels3d locks the surface until released
+        pygame.quit()
+
+    # One camera capture per refresh; frame n was submitted (logged) at n / fps and the pipeline
+    # adds args.latency, so every repeat pushes later frames back a refresh and every drop pulls them in
+    frames = np.stack([captures[frame_id] for frame_id in schedule])
+    capture_times = np.arange(len(schedule)) / args.fps + args.latency
+    ids = frame_sync.decode_frames(frames, patch)
+    first_refresh = {}
+    for refresh, frame_id in enumerate(schedule):
+        first_refresh.setdefault(frame_id, refresh)
+    expected_latency = np.array([(first_refresh[n] - n) / args.fps + args.latency for n in sorted(first_refresh)])
+
+    expected = (args.start_id + np.array(schedule)) % (1 << patch.bits)
+    decoded_ok = int((ids == expected).sum())
+    # Logged times are indexed by unwrapped id, as analyze() unwraps across the counter's end
+    logged_times = np.full(args.start_id + args.frames, np.nan)
+    logged_times[args.start_id:] = np.arange(args.frames) / args.fps
+    result = frame_sync.analyze(capture_times, ids, patch.bits, logged_times)
+    print(frame_sync.summarize(result))
+
+    found_drops = {int(i) - args.start_id for first, last in result["dropped_ranges"] for i in range(first, last + 1)}
+    found_repeats = {int(i) - args.start_id for i in result["repeated"]}
+    latency = result["latency"]
+    problems = []
+    if decoded_ok != len(schedule):
+        problems.append(f"{len(schedule) - decoded_ok} of {len(schedule)} captures decoded wrongly")
+    if found_drops != drops:
+        problems.append(f"dropped {sorted(found_drops)}, injected {sorted(drops)}")
+    if found_repeats != repeats:
+        problems.append(f"repeated {sorted(found_repeats)}, injected {sorted(repeats)}")
+    if len(latency) != len(expected_latency):
+        problems.append(f"{len(latency)} latency samples for {len(expected_latency)} shown frames")
+    elif np.abs(latency - expected_latency).max() > 1e-6:
+        problems.append(f"latency off by up to {np.abs(latency - expected_latency).max():.6f}s")
+    # Flash patch: the same schedule seen by a photodiode, ids recovered from the logged times
+    trace_times, trace_values = photodiode_trace(flash_levels, schedule, args.fps, args.latency, args.trace_rate,
+                                                 args.rise, noise=0.03 * 255)
+    transition_times, states = frame_sync.flash_transitions(trace_times, trace_values)
+    refresh_times, flash_ids = frame_sync.flash_ids(transition_times, states, logged_times)
+    flash_result = frame_sync.analyze(refresh_times, flash_ids, frame_sync.FLASH_BITS, logged_times)
+    print(frame_sync.summarize(flash_result))
+    flash_drops = {int(i) - args.start_id for first, last in flash_result["dropped_ranges"]
+                   for i in range(first, last + 1)}
+    flash_repeats = {int(i) - args.start_id for i in flash_result["repeated"]}
+    flash_latency = flash_result["latency"]
+    # Hysteresis fires about rise * ln(4) after the flip, plus up to one sample
+    allowed = args.rise * np.log(4) + 2.0 / args.trace_rate
+    if flash_drops != drops:
+        problems.append(f"flash: dropped {sorted(flash_drops)}, injected {sorted(drops)}")
+    if flash_repeats != repeats:
+        problems.append(f"flash: repeated {sorted(flash_repeats)}, injected {sorted(repeats)}")
+    if len(flash_latency) != len(expected_latency):
+        problems.append(f"flash: {len(flash_latency)} latency samples for {len(expected_latency)} shown frames")
+    elif np.abs(flash_latency - expected_latency).max() > allowed:
+        problems.append(f"flash: latency off by up to {np.abs(flash_latency - expected_latency).max():.4f}s")
+
+    for problem in problems:
+        print("FAILED: " + problem)
+    if problems:
+        return 1
+    print(f"OK: {decoded_ok} captures at {args.capture_width}x{capture_height} decoded, "
+          f"{len(drops)} drops and {len(repeats)} repeats found across the counter wrap, "
+          f"and found again from a {args.trace_rate:.0f} Hz photodiode trace of the flash patch")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+import argparse
+import math
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+import gaze_align
+import headless
+import session_log
+
+
+def record_session(session_dir, seconds, fps=30, start=1_700_000_000.0):
+    """ Horizontal raster session on a simulated clock, a ripple every 3 s, every other one answered """
+    headless.use_offscreen_pygame()
+    import pygame
+    import aruco_sim_horizontal
+
+    with headless.marker_workdir():
+        sim = aruco_sim_horizontal.ArUcoSimulation()
+        recorder = session_log.SessionRecorder(session_dir, config={
+            "script": "aruco_sim_horizontal.py", "marker_size": sim.marker_size,
+            "ripple_duration": sim.ripple_duration, "ripple_interval": sim.ripple_interval,
+        })
+        for frame in range(int(seconds * fps)):
+            now = start + frame / fps
+            sim.move_marker()
+            if sim.completed:
+                sim.restart_path()
+            recorder.record_frame(frame, now, sim.marker_rect.centerx, sim.marker_rect.centery)
+            if frame % (3 * fps) == 0 and frame:
+                ripple = frame // (3 * fps)
+                recorder.record_event(now, ripple, "onset")
+                recorder.record_event(now + sim.ripple_duration, ripple, "result",
+                                      "LOOKING" if ripple % 2 else "NOT LOOKING")
+        recorder.close()
+        pygame.quit()
+
+
+def record_gaze(path, session_dir, offset, drift, rate, noise, blink_fraction, seed=0):
+    """ Gaze CSV on its own clock (sim = offset + (1 + drift) * gaze), following the marker with noise and blinks """
+    rng = np.random.default_rng(seed)
+    trajectory = session_log.load_trajectory(session_dir)
+    traj_t, traj_x, traj_y = trajectory[:, 1], trajectory[:, 2], trajectory[:, 3]
+    # Tracker runs from 2 s before the session to 2 s after it
+    first = (traj_t[0] - 2 - offset) / (1 + drift)
+    last = (traj_t[-1] + 2 - offset) / (1 + drift)
+    gaze_time = np.arange(first, last, 1.0 / rate)
+    sim_time = offset + (1 + drift) * gaze_time
+    gaze_x = np.interp(sim_time, traj_t, traj_x) + rng.normal(0, noise, len(gaze_time))
+    gaze_y = np.interp(sim_time, traj_t, traj_y) + rng.normal(0, noise, len(gaze_time))
+
+    # Blinks: 150 ms gaps with no position, written as empty fields like trackers do
+    blink_samples = int(0.15 * rate)
+    blinks = rng.choice(len(gaze_time) - blink_samples, int(blink_fraction * len(gaze_time) / blink_samples))
+    missing = np.zeros(len(gaze_time), dtype=bool)
+    for start in blinks:
+        missing[start:start + blink_samples] = True
+
+    with open(path, "w") as f:
+        f.write("time,x,y\n")
+        for t, x, y, gone in zip(gaze_time, gaze_x, gaze_y, missing):
+            f.write(f"{t:.6f},,\n" if gone else f"{t:.6f},{x:.2f},{y:.2f}\n")
+    return int(missing.sum())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Round-trip check of gaze_align on a synthetic eye-tracker recording")
+    parser.add_argument("--seconds", type=float, default=300, help="session length")
+    parser.add_argument("--rate", type=float, default=250, help="gaze samples per second")
+    parser.add_argument("--offset", type=float, default=5.0, help="true clock offset in seconds")
+    parser.add_argument("--drift-ppm", type=float, default=20.0, help="true clock drift")
+    parser.add_argument("--noise", type=float, default=15.0, help="gaze noise per axis in pixels")
+    parser.add_argument("--blinks", type=float, default=0.03, help="fraction of samples lost to blinks")
+    parser.add_argument("--chunk", type=int, default=20000, help="gaze samples per chunk, small to exercise streaming")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as root:
+        session_dir = os.path.join(root, "session")
+        gaze_path = os.path.join(root, "gaze.csv")
+        record_session(session_dir, args.seconds)
+        start = session_log.load_trajectory(session_dir)[0, 1]
+        # Gaze clock starts near zero, like a tracker's own timestamps
+        true_offset = start + args.offset
+        missing = record_gaze(gaze_path, session_dir, true_offset, args.drift_ppm * 1e-6, args.rate,
+                              args.noise, args.blinks)
+
+        samples = session_log.load_trajectory(session_dir)
+        trajectory = (samples[:, 1], samples[:, 2], samples[:, 3])
+        ripples = gaze_align.ripple_windows(session_log.load_events(session_dir), 1)
+
+        def chunks():
+            return gaze_align.iter_gaze_chunks(gaze_path, args.chunk)
+
+        # Coarse offset as the tool assumes it: both recordings started together, so it is off by --offset
+        clock = gaze_align.estimate_clock(chunks(), trajectory)
+        accumulator, total, valid, mean_error = gaze_align.align(chunks(), trajectory, clock, ripples,
+                                                                 hit_radius=150)
+
+    offset_error = abs(clock.offset - true_offset)
+    drift_error = abs(clock.drift - args.drift_ppm * 1e-6) * 1e6
+    expected_error = args.noise * math.sqrt(math.pi / 2)  # Mean of a 2D Gaussian distance
+    print(f"{total} gaze samples ({missing} in blinks), {valid} matched, {len(list(accumulator.rows()))} ripples")
+    print(f"Offset error {offset_error * 1000:.3f} ms, drift error {drift_error:.2f} ppm, "
+          f"mean error {mean_error:.1f} px (noise alone gives {expected_error:.1f} px)")
+    if offset_error > 0.001 or drift_error > 5 or abs(mean_error - expected_error) > 0.1 * expected_error:
+        print("FAILED")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
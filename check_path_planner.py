@@ -0,0 +1,91 @@
+import argparse
+import sys
+import tempfile
+
+import numpy as np
+
+import headless
+import path_planner
+
+
+def sim_positions(module_name, planned_path=None, limit=100000):
+    """ Marker positions from the sim's own move_marker, from the start until it reports completed """
+    module = __import__(module_name)
+    sim = module.ArUcoSimulation(planned_path=planned_path)
+    positions = [(sim.current_x, sim.current_y)]  # The rect only moves there on the first move_marker
+    while not sim.completed and len(positions) < limit:
+        sim.move_marker()
+        positions.append(sim.marker_rect.topleft)
+    return np.array(positions, dtype=np.float64), sim
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the coverage planner against the fixed rasters it replaces")
+    parser.add_argument("--region", type=path_planner.parse_region, default=[1000, 400, 800, 500, 3],
+                        help="x,y,width,height,weight region for the weighted check")
+    args = parser.parse_args(argv)
+
+    headless.use_offscreen_pygame()
+    import pygame
+
+    problems = []
+    with headless.marker_workdir(), tempfile.TemporaryDirectory() as cache_dir:
+        rasters = {}
+        for name, vertical in (("horizontal", False), ("vertical", True)):
+            real, sim = sim_positions(f"aruco_sim_{name}")
+            stepped = path_planner.raster_positions(sim.width, sim.height, sim.marker_size, sim.speed_x, sim.speed_y,
+                                                    sim.grid_size, (sim.padding_left, sim.padding_top,
+                                                                    sim.padding_right, sim.padding_bottom), vertical)
+            if not np.array_equal(real, stepped):
+                problems.append(f"raster_positions does not reproduce the {name} sim's move_marker")
+            rasters[name] = real
+
+        width, height, marker_size, speed = sim.width, sim.height, sim.marker_size, max(sim.speed_x, sim.speed_y)
+        low, high = path_planner.padded_area(width, height, marker_size)
+
+        # Equal coverage: density 1 may leave no larger gap than the raster, and must take fewer frames
+        plan = path_planner.plan_path(width, height, marker_size, speed, cache_dir=cache_dir)
+        planned, _ = sim_positions("aruco_sim_horizontal", plan)
+        plan_gap = path_planner.coverage_radius(planned, low, high)
+        plan_frames = len(planned) - 1
+        steps = np.hypot(*np.diff(planned, axis=0).T).max()
+        print(f"Plan at density 1: {plan_frames} frames, largest gap {plan_gap:.1f}px, fastest step {steps:.1f}px")
+        for name, raster in rasters.items():
+            gap = path_planner.coverage_radius(raster, low, high)
+            print(f"Fixed {name} raster: {len(raster) - 1} frames, largest gap {gap:.1f}px")
+            if plan_gap > gap + 1:
+                problems.append(f"plan leaves a {plan_gap:.1f}px gap, the {name} raster {gap:.1f}px")
+            if plan_frames >= len(raster) - 1:
+                problems.append(f"plan takes {plan_frames} frames, the {name} raster {len(raster) - 1}")
+        # Rounding to whole pixels in move_along_plan may add under a pixel per axis
+        if steps > speed + 1.5:
+            problems.append(f"plan moves {steps:.1f}px in one frame, the limit is {speed}")
+
+        # Weighted region: swept weight times denser than the rest
+        spacing = path_planner.raster_pitch(speed)
+        weighted = path_planner.plan_path(width, height, marker_size, speed, regions=[args.region],
+                                          cache_dir=cache_dir).positions()
+        (box,) = [(box_low, box_high) for box_low, box_high, _ in
+                  path_planner.region_boxes(width, height, marker_size, path_planner.PADDING, [args.region])]
+        region_gap = path_planner.coverage_radius(weighted, low, high, box)
+        print(f"Weighted plan: {len(weighted) - 1} frames, largest gap {region_gap:.1f}px inside the region")
+        if region_gap > spacing / 2 / args.region[4] + 1:
+            problems.append(f"region gap {region_gap:.1f}px, expected at most {spacing / 2 / args.region[4]:.1f}px")
+
+        # Cached plans come back identical
+        path_planner._memory_cache.clear()
+        cached = path_planner.plan_path(width, height, marker_size, speed, cache_dir=cache_dir)
+        if not np.array_equal(cached.waypoints, plan.waypoints):
+            problems.append("plan read back from the cache differs")
+        pygame.quit()
+
+    for problem in problems:
+        print("FAILED: " + problem)
+    if problems:
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+import argparse
+import random
+import sys
+
+import cv2
+import numpy as np
+
+import headless
+
+
+def detect_center(frame_rgb, detector):
+    gray = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2GRAY)
+    corners, ids, _ = detector.detectMarkers(gray)
+    if ids is None or 0 not in ids.ravel():
+        return None
+    return corners[list(ids.ravel()).index(0)][0].mean(axis=0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that slow sub-pixel motion keeps the marker detectable and on target")
+    parser.add_argument("--frames", type=int, default=2000)
+    parser.add_argument("--every", type=int, default=7, help="detect on one frame in this many")
+    parser.add_argument("--speed-x", type=float, default=0.3)
+    parser.add_argument("--speed-y", type=float, default=0.2)
+    parser.add_argument("--max-error", type=float, default=0.5, help="allowed detected-center error in pixels")
+    args = parser.parse_args(argv)
+
+    headless.use_offscreen_pygame()
+    import pygame
+    import aruco_sim_light
+
+    random.seed(0)  # The sim starts at a random position
+    detector = cv2.aruco.ArucoDetector(cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50),
+                                       cv2.aruco.DetectorParameters())
+    missed = 0
+    errors = []
+    with headless.marker_workdir():
+        sim = aruco_sim_light.ArUcoSimulation(speed_x=args.speed_x, speed_y=args.speed_y, subpixel=True)
+        for frame in range(args.frames):
+            sim.move_marker()
+            if frame % args.every:
+                continue
+            sim.draw_frame()
+            # surfarray is (width, height, 3), the detector wants rows first
+            center = detect_center(np.ascontiguousarray(pygame.surfarray.array3d(sim.window).swapaxes(0, 1)), detector)
+            if center is None:
+                missed += 1
+                continue
+            # Detector corners are in pixel-center coordinates, hence size - 1
+            expected = np.array([sim.position_x, sim.position_y]) + (sim.marker_size - 1) / 2
+            errors.append(float(np.hypot(*(center - expected))))
+        cache = sim.marker_cache
+        pygame.quit()
+
+    checked = len(errors) + missed
+    print(f"{checked} frames checked: {missed} missed, center error mean {np.mean(errors):.3f} px, "
+          f"max {np.max(errors):.3f} px, cache {cache.hits} hits / {cache.misses} misses")
+    if missed or max(errors) > args.max_error:
+        print("FAILED")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
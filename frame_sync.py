@@ -0,0 +1,373 @@
+import argparse
+import sys
+
+import numpy as np
+
+import session_log
+
+MAX_JUMP = 256  # Largest id change between neighbouring captures that is still believed
+FLASH_BITS = 62  # Flash ids come from the session log and never wrap, analyze them on a counter this wide
+
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+
+
+class FrameCodePatch:
+    """ Small bottom-right patch carrying the frame counter, for measuring when frames really reach the screen
+
+    mode "code": a row of cells [white ref][black ref][Gray-coded frame id, MSB first][even parity]
+    mode "flash": one square that alternates white/black every frame, for a photodiode
+    """
+
+    def __init__(self, width, height, bits=20, cell=8, margin=4, mode="code", flash_size=24):
+        self.width = width
+        self.height = height
+        self.bits = bits
+        self.cell = cell
+        self.margin = margin
+        self.mode = mode
+        self.flash_size = flash_size
+        # Kept inside the scripts' 30 px bottom/right padding so the marker never covers it
+        if mode == "flash":
+            self.rects = [(width - margin - flash_size, height - margin - flash_size, flash_size, flash_size)]
+        else:
+            cells = bits + 3
+            left = width - margin - cells * cell
+            top = height - margin - cell
+            self.rects = [(left + i * cell, top, cell, cell) for i in range(cells)]
+
+    def cell_values(self, frame_id):
+        if self.mode == "flash":
+            return [frame_id % 2 == 0]
+        code = gray_encode(frame_id % (1 << self.bits))
+        data = [bool(code >> (self.bits - 1 - i) & 1) for i in range(self.bits)]
+        return [True, False] + data + [sum(data) % 2 == 1]
+
+    def draw(self, surface, frame_id):
+        # surface.fill with a rect is the cheapest pygame primitive, a handful per frame
+        for rect, value in zip(self.rects, self.cell_values(frame_id)):
+            surface.fill(WHITE if value else BLACK, rect)
+
+    def sample_points(self, frame_width, frame_height):
+        # 3x3 sample grid in the middle of every cell, scaled to the captured resolution
+        scale_x = frame_width / self.width
+        scale_y = frame_height / self.height
+        offsets = np.array([-1, 0, 1]) * max(1, self.cell // 4)
+        xs = []
+        ys = []
+        for x, y, w, h in self.rects:
+            center_x = x + w // 2
+            center_y = y + h // 2
+            grid_y, grid_x = np.meshgrid(center_y + offsets, center_x + offsets, indexing="ij")
+            xs.append(np.clip(np.rint(grid_x.ravel() * scale_x), 0, frame_width - 1))
+            ys.append(np.clip(np.rint(grid_y.ravel() * scale_y), 0, frame_height - 1))
+        return np.array(ys, dtype=np.int64), np.array(xs, dtype=np.int64)
+
+
+def gray_encode(value):
+    return value ^ (value >> 1)
+
+
+def gray_decode(code, bits):
+    # Works element-wise on integer arrays
+    value = code.copy()
+    shift = 1
+    while shift < bits:
+        value ^= value >> shift
+        shift <<= 1
+    return value
+
+
+def cell_levels(frames, patch):
+    """ (N, cells) mean brightness of every patch cell in a stack of (N, H, W) or (N, H, W, 3) frames """
+    frames = np.asarray(frames)
+    ys, xs = patch.sample_points(frames.shape[2], frames.shape[1])
+    samples = frames[:, ys, xs].astype(np.float32)  # (N, cells, 9[, 3])
+    if samples.ndim == 4:
+        samples = samples.mean(axis=3)
+    return samples.mean(axis=2)
+
+
+def decode_frames(frames, patch, min_contrast=40):
+    """ Frame id for every captured frame, -1 where the code is unreadable (mid-refresh capture, occlusion) """
+    levels = cell_levels(frames, patch)
+    white = levels[:, 0]
+    black = levels[:, 1]
+    bits = levels[:, 2:] > ((white + black) / 2)[:, None]
+    data = bits[:, :patch.bits]
+    parity_ok = (data.sum(axis=1) % 2 == 1) == bits[:, patch.bits]
+
+    weights = 1 << np.arange(patch.bits - 1, -1, -1, dtype=np.int64)
+    ids = gray_decode((data * weights).sum(axis=1), patch.bits)
+    valid = parity_ok & (white - black >= min_contrast)
+    return np.where(valid, ids, -1)
+
+
+def flash_transitions(times, values, low=None, high=None):
+    """ Times at which a photodiode trace of the flash patch changes state, and the new state (True = white)
+
+    Hysteresis keeps noise around a single threshold from counting as extra flips: the state only changes
+    once the trace crosses the far one of low and high, by default a quarter and three quarters of the range.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    times = np.asarray(times, dtype=np.float64)
+    dark, bright = np.percentile(values, 5), np.percentile(values, 95)
+    low = dark + 0.25 * (bright - dark) if low is None else low
+    high = dark + 0.75 * (bright - dark) if high is None else high
+    decided = (values >= high) | (values <= low)
+    if not decided.any():
+        return times[:0], np.zeros(0, dtype=bool)
+    # Carry the last decided state through the samples between the thresholds
+    last = np.maximum.accumulate(np.where(decided, np.arange(len(values)), 0))
+    last[:np.argmax(decided)] = np.argmax(decided)
+    state = values[last] >= high
+    changes = np.flatnonzero(state[1:] != state[:-1]) + 1
+    return times[changes], state[changes]
+
+
+def flash_ids(transition_times, states, logged_times, min_latency=0.0):
+    """ (refresh times, frame ids) from flash transitions, for analyze(); needs the session's logged frame times
+
+    The flash only shows the parity of the frame id, so ids come from the logged times:
+    the first transition is the newest frame of its colour logged at least min_latency earlier, which
+    is right while the real latency stays below min_latency plus two frames. After that every flip
+    advances an odd number of frames; the most that keeps the display from running ahead of the sim
+    and the latency from falling clearly below the lowest seen so far is taken.
+    A frame shown without a flip (its neighbour was dropped, or it is a repeat) is invisible to the
+    photodiode, so those refreshes are filled in: repeats of the previous frame first, then the newest
+    frames of the previous colour, as a late frame holds the screen and a catching-up one skips.
+    """
+    transition_times = np.asarray(transition_times, dtype=np.float64)
+    logged_times = np.asarray(logged_times, dtype=np.float64)
+    interval = float(np.median(np.diff(transition_times))) if len(transition_times) > 1 else 0.0
+    known = np.flatnonzero(~np.isnan(logged_times))
+
+    refresh_times = []
+    ids = []
+    previous = None
+    for time, white in zip(transition_times, states):
+        parity = 0 if white else 1
+        if previous is None:
+            candidates = known[(known % 2 == parity) & (logged_times[known] <= time - min_latency)]
+            if not len(candidates):
+                continue
+            chosen = int(candidates[-1])
+            floor = time - logged_times[chosen]
+        else:
+            chosen = None
+            frame = previous + 1
+            while frame < len(logged_times) and not logged_times[frame] > time - min_latency:
+                if not np.isnan(logged_times[frame]) and time - logged_times[frame] >= floor - interval / 2:
+                    chosen = frame
+                frame += 2
+            if chosen is None:
+                if previous + 1 >= len(logged_times) or np.isnan(logged_times[previous + 1]):
+                    continue  # Beyond the log, nothing to match this flip against
+                chosen = previous + 1
+            floor = min(floor, time - logged_times[chosen])
+
+            refreshes = max(1, int(round((time - previous_time) / interval)))
+            hidden = list(range(previous + 2, chosen, 2))[-(refreshes - 1):] if refreshes > 1 else []
+            hidden = [previous] * (refreshes - 1 - len(hidden)) + hidden
+            for step, frame in enumerate(hidden, 1):
+                refresh_times.append(previous_time + (time - previous_time) * step / refreshes)
+                ids.append(frame)
+        refresh_times.append(time)
+        ids.append(chosen)
+        previous, previous_time = chosen, time
+    return np.array(refresh_times), np.array(ids, dtype=np.int64)
+
+
+def load_trace(path):
+    """ (times, values) from a photodiode CSV whose first two columns are time in seconds and the reading """
+    data = np.loadtxt(path, delimiter=",", skiprows=1, usecols=(0, 1), ndmin=2)
+    return data[:, 0], data[:, 1]
+
+
+def circular_step(a, b, bits):
+    # Signed distance from id a to id b on the 2**bits counter circle, in [-2**(bits-1), 2**(bits-1))
+    half = 1 << (bits - 1)
+    return (b - a + half) % (1 << bits) - half
+
+
+def plausible_ids(ids, bits, max_jump=MAX_JUMP):
+    """ Mask of ids that agree with their neighbours
+
+    Parity only catches an odd number of bit errors, so a misread can still decode to a valid looking id.
+    A real id is within max_jump frames of at least two of its four nearest neighbours; a misread is not.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    count = len(ids)
+    if count < 3:
+        return np.ones(count, dtype=bool)
+    agree = np.zeros(count, dtype=np.int64)
+    available = np.zeros(count, dtype=np.int64)
+    for shift in (-2, -1, 1, 2):
+        if abs(shift) >= count:
+            continue
+        if shift > 0:
+            here, there = slice(0, count - shift), slice(shift, count)
+        else:
+            here, there = slice(-shift, count), slice(0, count + shift)
+        close = np.abs(circular_step(ids[here], ids[there], bits)) <= max_jump
+        agree[here] += close
+        available[here] += 1
+    # Near the ends fewer neighbours exist, one agreeing neighbour is enough there
+    return agree >= np.minimum(2, available - 1)
+
+
+def unwrap_ids(ids, bits, max_jump=MAX_JUMP):
+    """ Continuous ids: 2**bits is added only where the counter really wrapped (from near the top to near 0) """
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(ids) < 2:
+        return ids.copy()
+    period = 1 << bits
+    wrapped = (ids[:-1] >= period - max_jump) & (ids[1:] < max_jump)
+    return ids + np.concatenate([[0], np.cumsum(wrapped)]) * period
+
+
+def analyze(capture_times, ids, bits, logged_times=None, max_jump=MAX_JUMP):
+    """ Dropped and repeated frames from decoded ids, latency if the session's logged frame times are given
+
+    dropped_ranges holds (first, last) inclusive id ranges, so a long gap costs one row, not one entry per frame.
+    """
+    capture_times = np.asarray(capture_times, dtype=np.float64)
+    ids = np.asarray(ids, dtype=np.int64)
+    readable = ids >= 0
+    capture_times, ids = capture_times[readable], ids[readable]
+
+    # Misreads that slipped past the parity check, then anything still running backwards after unwrapping
+    plausible = plausible_ids(ids, bits, max_jump)
+    capture_times, ids = capture_times[plausible], unwrap_ids(ids[plausible], bits, max_jump)
+    forward = ids >= np.maximum.accumulate(ids) if len(ids) else np.ones(0, dtype=bool)
+    rejected = int((~plausible).sum() + (~forward).sum())
+    capture_times, ids = capture_times[forward], ids[forward]
+
+    # First capture of every displayed frame
+    first = np.concatenate([[True], ids[1:] != ids[:-1]])
+    shown_ids = ids[first]
+    shown_at = capture_times[first]
+
+    gaps = np.diff(shown_ids)
+    dropped_ranges = np.column_stack([shown_ids[:-1][gaps > 1] + 1, shown_ids[1:][gaps > 1] - 1])
+    on_screen = np.diff(shown_at)
+    nominal = np.median(on_screen) if len(on_screen) else 0.0
+    # A frame held for more than one refresh was repeated by the display pipeline
+    repeated = shown_ids[:-1][on_screen > 1.5 * nominal] if nominal else np.array([], dtype=np.int64)
+
+    result = {
+        "captured": int(readable.sum()),
+        "unreadable": int((~readable).sum()),
+        "rejected": rejected,
+        "shown": int(len(shown_ids)),
+        "dropped": int((gaps[gaps > 1] - 1).sum()),
+        "dropped_ranges": dropped_ranges.astype(np.int64).reshape(-1, 2),
+        "repeated": repeated,
+        "frame_interval": float(nominal),
+    }
+    if logged_times is not None:
+        logged_times = np.asarray(logged_times, dtype=np.float64)
+        known = shown_ids < len(logged_times)
+        latency = shown_at[known] - logged_times[shown_ids[known]]
+        result["latency"] = latency[~np.isnan(latency)]
+    return result
+
+
+def iter_video_frames(path, chunk_frames=256):
+    """ Grey frames and their timestamps (seconds from the start of the video), a chunk at a time """
+    import cv2
+    capture = cv2.VideoCapture(path)
+    try:
+        while True:
+            frames = []
+            times = []
+            for _ in range(chunk_frames):
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                times.append(capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0)
+                frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+            if not frames:
+                break
+            yield np.array(times), np.stack(frames)
+    finally:
+        capture.release()
+
+
+def summarize(result):
+    lines = [f"{result['shown']} frames seen in {result['captured']} readable captures "
+             f"({result['unreadable']} unreadable, {result['rejected']} rejected as misreads), "
+             f"frame interval {result['frame_interval'] * 1000:.1f} ms",
+             f"Dropped frames: {result['dropped']} in {len(result['dropped_ranges'])} gap(s), "
+             f"repeated frames: {len(result['repeated'])}"]
+    latency = result.get("latency")
+    if latency is not None and len(latency):
+        lines.append(f"Display latency: mean {latency.mean() * 1000:.1f} ms, "
+                     f"p50 {np.percentile(latency, 50) * 1000:.1f} ms, "
+                     f"p95 {np.percentile(latency, 95) * 1000:.1f} ms, max {latency.max() * 1000:.1f} ms")
+    return "\n".join(lines)
+
+
+def logged_frame_times(session_dir):
+    # Logged time per frame id, NaN for ids the session did not record
+    trajectory = session_log.load_trajectory(session_dir)
+    logged_times = np.full(int(trajectory[:, 0].max()) + 1, np.nan)
+    logged_times[trajectory[:, 0].astype(np.int64)] = trajectory[:, 1]
+    return logged_times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Decode frame-code patches from a captured video or flash patches "
+                                                 "from a photodiode trace")
+    parser.add_argument("capture", help="code: video of the stimulus screen (full screen, any resolution); "
+                                        "flash: photodiode CSV with time and reading as its first two columns")
+    parser.add_argument("--mode", choices=("code", "flash"), default="code", help="the patch the sim drew")
+    parser.add_argument("--width", type=int, default=3440, help="stimulus resolution the patch was drawn at")
+    parser.add_argument("--height", type=int, default=1400)
+    parser.add_argument("--bits", type=int, default=20, help="must match the patch; 20 bits wrap after ~9 h at 30 fps")
+    parser.add_argument("--cell", type=int, default=8)
+    parser.add_argument("--session", help="session directory, to compute latency against the logged frame times")
+    parser.add_argument("--capture-start", type=float,
+                        help="wall-clock time of the first video frame or trace sample, on the session's clock")
+    parser.add_argument("--min-latency", type=float, default=0.0,
+                        help="flash: lower bound on the display latency, the true one must be below this plus two frames")
+    args = parser.parse_args(argv)
+    if args.session and args.capture_start is None:
+        parser.error("--session needs --capture-start to put the capture on the session clock")
+
+    if args.mode == "flash":
+        if not args.session:
+            parser.error("--mode flash needs --session: the flash only carries the frame parity")
+        times, values = load_trace(args.capture)
+        logged_times = logged_frame_times(args.session)
+        transition_times, states = flash_transitions(times + args.capture_start, values)
+        refresh_times, ids = flash_ids(transition_times, states, logged_times, args.min_latency)
+        if not len(ids):
+            print(f"No flash transitions in {args.capture} matched the session")
+            return 1
+        print(summarize(analyze(refresh_times, ids, FLASH_BITS, logged_times)))
+        return 0
+
+    patch = FrameCodePatch(args.width, args.height, bits=args.bits, cell=args.cell)
+    all_times = []
+    all_ids = []
+    for times, frames in iter_video_frames(args.capture):
+        all_times.append(times)
+        all_ids.append(decode_frames(frames, patch))
+    if not all_ids:
+        print(f"No frames could be read from {args.capture}")
+        return 1
+    capture_times = np.concatenate(all_times)
+    ids = np.concatenate(all_ids)
+
+    logged_times = None
+    if args.session:
+        capture_times = capture_times + args.capture_start
+        logged_times = logged_frame_times(args.session)
+
+    print(summarize(analyze(capture_times, ids, args.bits, logged_times)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,305 @@
+import argparse
+import io
+import itertools
+import sys
+
+import numpy as np
+
+import session_log
+
+CHUNK_SAMPLES = 500000  # Gaze samples held in memory at once
+WINDOW_SECONDS = 30.0  # Length of the stretches used to estimate the clock offset
+MAX_LAG = 10.0  # Seconds searched on either side of the coarse offset
+COARSE_LAG_STEP = 0.05
+LAG_STEP = 0.002
+MAX_WINDOW_POINTS = 2000  # Gaze samples per window used for the lag search
+
+
+def fill_blank_fields(text):
+    """ Write nan into the empty fields trackers leave during blinks, so the C parser of np.loadtxt accepts them """
+    # Every replace copies the whole chunk, so each one only runs when its pattern occurs.
+    # A blink is usually "time,,", which the first replace fills completely
+    if ",,\n" in text:
+        text = text.replace(",,\n", ",nan,nan\n")
+    while ",," in text:  # ",,," overlaps, one pass leaves every other pair behind
+        text = text.replace(",,", ",nan,")
+    if ",\n" in text:
+        text = text.replace(",\n", ",nan\n")
+    if "\n," in text:
+        text = text.replace("\n,", "\nnan,")
+    if text.startswith(","):
+        text = "nan" + text
+    if text.endswith(","):
+        text += "nan"
+    return text
+
+
+def iter_gaze_chunks(path, chunk_samples=CHUNK_SAMPLES, columns=("time", "x", "y"), time_scale=1.0):
+    """ Yield (N, 3) float arrays of gaze time (seconds), x, y without loading the whole recording """
+    if path.endswith(".npy"):
+        # Memory-mapped, the columns are expected in time, x, y order
+        data = np.load(path, mmap_mode="r")
+        for start in range(0, len(data), chunk_samples):
+            chunk = np.array(data[start:start + chunk_samples, :3], dtype=np.float64)
+            chunk[:, 0] *= time_scale
+            yield chunk
+        return
+
+    with open(path) as f:
+        header = [name.strip() for name in f.readline().split(",")]
+        try:
+            usecols = [header.index(name) for name in columns]
+        except ValueError:
+            raise ValueError(f"{path} needs the columns {', '.join(columns)}, found {', '.join(header)}")
+        while True:
+            lines = list(itertools.islice(f, chunk_samples))
+            if not lines:
+                break
+            # np.loadtxt parses in C, several times faster than genfromtxt, but only takes numbers
+            text = fill_blank_fields("".join(lines))
+            try:
+                chunk = np.loadtxt(io.StringIO(text), delimiter=",", usecols=usecols, dtype=np.float64, ndmin=2)
+            except ValueError:
+                # Odd fields such as whitespace-only blanks: the slow parser turns anything unreadable into NaN
+                chunk = np.genfromtxt(lines, delimiter=",", usecols=usecols, dtype=np.float64, ndmin=2)
+            chunk[:, 0] *= time_scale
+            yield chunk
+
+
+class ClockModel:
+    """ Maps gaze timestamps onto the simulation clock: sim_time = offset + (1 + drift) * gaze_time """
+
+    def __init__(self, offset, drift=0.0):
+        self.offset = offset
+        self.drift = drift
+
+    def to_sim_time(self, gaze_time):
+        return self.offset + (1.0 + self.drift) * gaze_time
+
+
+def lag_costs(gaze_time, gaze_x, gaze_y, trajectory, offset, lags):
+    # Mean squared gaze-to-marker distance for every candidate lag, in one (lags, samples) pass
+    traj_t, traj_x, traj_y = trajectory
+    shifted = gaze_time[None, :] + offset + lags[:, None]
+    inside = (shifted >= traj_t[0]) & (shifted <= traj_t[-1])
+    marker_x = np.interp(shifted, traj_t, traj_x)
+    marker_y = np.interp(shifted, traj_t, traj_y)
+    squared = np.where(inside, (marker_x - gaze_x) ** 2 + (marker_y - gaze_y) ** 2, 0.0)
+    counts = inside.sum(axis=1)
+    # Lags that push most of the window off either end of the session are not comparable
+    enough = counts >= max(10, len(gaze_time) // 2)
+    return np.where(enough, squared.sum(axis=1) / np.maximum(counts, 1), np.inf)
+
+
+def window_lag(gaze_time, gaze_x, gaze_y, trajectory, offset, max_lag=MAX_LAG):
+    """ Best extra lag for one window, found by matching gaze against the marker path at every candidate lag """
+    valid = ~(np.isnan(gaze_x) | np.isnan(gaze_y))
+    gaze_time, gaze_x, gaze_y = gaze_time[valid], gaze_x[valid], gaze_y[valid]
+    if len(gaze_time) > MAX_WINDOW_POINTS:
+        stride = len(gaze_time) // MAX_WINDOW_POINTS + 1
+        gaze_time, gaze_x, gaze_y = gaze_time[::stride], gaze_x[::stride], gaze_y[::stride]
+    if len(gaze_time) < 20:
+        return None
+
+    # Coarse grid over the whole search range first
+    lags = np.arange(-max_lag, max_lag + COARSE_LAG_STEP / 2, COARSE_LAG_STEP)
+    cost = lag_costs(gaze_time, gaze_x, gaze_y, trajectory, offset, lags)
+    best = int(np.argmin(cost))
+    if not np.isfinite(cost[best]):
+        return None
+    # A still marker (pause, countdown) matches every lag equally well, skip those windows
+    finite = cost[np.isfinite(cost)]
+    if np.median(finite) < 1.5 * cost[best]:
+        return None
+
+    # Then a fine grid around the coarse minimum
+    lags = lags[best] + np.arange(-COARSE_LAG_STEP, COARSE_LAG_STEP + LAG_STEP / 2, LAG_STEP)
+    cost = lag_costs(gaze_time, gaze_x, gaze_y, trajectory, offset, lags)
+    best = int(np.argmin(cost))
+    lag = lags[best]
+    if 0 < best < len(lags) - 1 and np.isfinite(cost[best - 1]) and np.isfinite(cost[best + 1]):
+        # Parabolic refinement between grid points
+        denominator = cost[best - 1] - 2 * cost[best] + cost[best + 1]
+        if denominator > 0:
+            lag += 0.5 * LAG_STEP * (cost[best - 1] - cost[best + 1]) / denominator
+    return lag
+
+
+def estimate_clock(chunks, trajectory, coarse_offset=None, window_seconds=WINDOW_SECONDS, max_lag=MAX_LAG):
+    """ First pass: per-window offsets, then a robust straight-line fit gives offset and drift """
+    times = []
+    offsets = []
+    for chunk in chunks:
+        gaze_time = chunk[:, 0]
+        if coarse_offset is None:
+            # Assume both recordings started at roughly the same moment
+            coarse_offset = trajectory[0][0] - gaze_time[0]
+        window = np.floor((gaze_time - gaze_time[0]) / window_seconds).astype(np.int64)
+        boundaries = np.flatnonzero(np.diff(window)) + 1
+        for part in np.split(np.arange(len(gaze_time)), boundaries):
+            lag = window_lag(gaze_time[part], chunk[part, 1], chunk[part, 2], trajectory, coarse_offset, max_lag)
+            if lag is not None:
+                times.append(gaze_time[part].mean())
+                offsets.append(coarse_offset + lag)
+
+    if not offsets:
+        raise ValueError("Could not match the gaze recording to the marker path in any window")
+    times = np.array(times)
+    offsets = np.array(offsets)
+    if len(offsets) < 3:
+        return ClockModel(float(np.median(offsets)))
+
+    # Drop windows that locked onto the wrong sweep (far from the median offset), fit a
+    # line to the rest, then repeat once against that line. Times are centered to keep
+    # the fit well conditioned.
+    center = times.mean()
+    slope, intercept = 0.0, float(np.median(offsets))
+    for _ in range(2):
+        residual = offsets - (intercept + slope * (times - center))
+        spread = 1.4826 * np.median(np.abs(residual)) + LAG_STEP
+        keep = np.abs(residual) <= 3 * spread
+        if keep.sum() < 2:
+            break
+        slope, intercept = np.polyfit(times[keep] - center, offsets[keep], 1)
+    intercept -= slope * center
+    # offset(t) = intercept + slope * t, so sim = intercept + (1 + slope) * t
+    return ClockModel(float(intercept), float(slope))
+
+
+def ripple_windows(events, ripple_duration):
+    onsets = {}
+    statuses = {}
+    for event in events:
+        if event["event"] == "onset":
+            onsets[event["ripple"]] = event["time"]
+        elif event["event"] == "result":
+            statuses[event["ripple"]] = event["status"]
+    ripples = sorted(onsets)
+    return (np.array(ripples, dtype=np.int64),
+            np.array([onsets[r] for r in ripples], dtype=np.float64),
+            [statuses.get(r, "") for r in ripples],
+            ripple_duration)
+
+
+class RippleAccumulator:
+    # Per-ripple sums, so summaries need no per-sample storage
+    def __init__(self, ripples, hit_radius):
+        self.numbers, self.onsets, self.statuses, self.duration = ripples
+        self.hit_radius = hit_radius
+        size = len(self.numbers)
+        self.samples = np.zeros(size)
+        self.error_sum = np.zeros(size)
+        self.error_squared = np.zeros(size)
+        self.hits = np.zeros(size)
+
+    def add(self, sim_time, error):
+        if not len(self.onsets):
+            return
+        index = np.searchsorted(self.onsets, sim_time, side="right") - 1
+        inside = (index >= 0) & ~np.isnan(error)
+        inside[inside] &= sim_time[inside] < self.onsets[index[inside]] + self.duration
+        index, error = index[inside], error[inside]
+        size = len(self.numbers)
+        self.samples += np.bincount(index, minlength=size)
+        self.error_sum += np.bincount(index, weights=error, minlength=size)
+        self.error_squared += np.bincount(index, weights=error * error, minlength=size)
+        self.hits += np.bincount(index, weights=(error <= self.hit_radius).astype(np.float64), minlength=size)
+
+    def rows(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = self.error_sum / self.samples
+            rms = np.sqrt(self.error_squared / self.samples)
+            hit_fraction = self.hits / self.samples
+        for i, number in enumerate(self.numbers):
+            yield (int(number), self.onsets[i], self.statuses[i], int(self.samples[i]),
+                   mean[i], rms[i], hit_fraction[i])
+
+
+def align(chunks, trajectory, clock, ripples, hit_radius, output=None):
+    """ Second pass: marker position at every gaze sample, written out chunk by chunk """
+    traj_t, traj_x, traj_y = trajectory
+    accumulator = RippleAccumulator(ripples, hit_radius)
+    total = 0
+    error_sum = 0.0
+    valid_total = 0
+    if output:
+        output.write("gaze_time,sim_time,marker_x,marker_y,gaze_x,gaze_y,error_px\n")
+    for chunk in chunks:
+        gaze_time, gaze_x, gaze_y = chunk[:, 0], chunk[:, 1], chunk[:, 2]
+        sim_time = clock.to_sim_time(gaze_time)
+        marker_x = np.interp(sim_time, traj_t, traj_x)
+        marker_y = np.interp(sim_time, traj_t, traj_y)
+        error = np.hypot(gaze_x - marker_x, gaze_y - marker_y)
+        # Samples outside the session have no marker to compare against
+        outside = (sim_time < traj_t[0]) | (sim_time > traj_t[-1])
+        marker_x[outside] = np.nan
+        marker_y[outside] = np.nan
+        error[outside] = np.nan
+
+        accumulator.add(sim_time, error)
+        valid = ~np.isnan(error)
+        total += len(error)
+        valid_total += int(valid.sum())
+        error_sum += float(error[valid].sum())
+        if output:
+            np.savetxt(output, np.column_stack([gaze_time, sim_time, marker_x, marker_y, gaze_x, gaze_y, error]),
+                       delimiter=",", fmt="%.6f")
+    return accumulator, total, valid_total, (error_sum / valid_total if valid_total else float("nan"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Align an eye-tracker recording with a recorded simulation session")
+    parser.add_argument("session_dir", help="directory written by SessionRecorder")
+    parser.add_argument("gaze", help="gaze recording, CSV with a header or an (N, 3) .npy of time, x, y")
+    parser.add_argument("--columns", default="time,x,y", help="CSV column names for time, x and y")
+    parser.add_argument("--time-scale", type=float, default=1.0,
+                        help="factor turning gaze timestamps into seconds (0.001 for ms)")
+    parser.add_argument("--offset", type=float, help="known clock offset in seconds, skips the estimate")
+    parser.add_argument("--drift", type=float, default=0.0, help="known drift, used together with --offset")
+    parser.add_argument("--max-lag", type=float, default=MAX_LAG, help="seconds searched around the coarse offset")
+    parser.add_argument("--window", type=float, default=WINDOW_SECONDS, help="seconds per offset estimate")
+    parser.add_argument("--chunk", type=int, default=CHUNK_SAMPLES, help="gaze samples per chunk")
+    parser.add_argument("--hit-radius", type=float, help="pixels counted as on target (default half the marker)")
+    parser.add_argument("--output", help="per-sample CSV")
+    parser.add_argument("--summary", help="per-ripple CSV")
+    args = parser.parse_args(argv)
+
+    config = session_log.load_config(args.session_dir)
+    samples = session_log.load_trajectory(args.session_dir)
+    trajectory = (samples[:, 1], samples[:, 2], samples[:, 3])
+    ripples = ripple_windows(session_log.load_events(args.session_dir), config.get("ripple_duration", 1))
+    hit_radius = args.hit_radius or config.get("marker_size", 300) / 2
+
+    columns = tuple(args.columns.split(","))
+
+    def chunks():
+        return iter_gaze_chunks(args.gaze, args.chunk, columns, args.time_scale)
+
+    if args.offset is not None:
+        clock = ClockModel(args.offset, args.drift)
+    else:
+        clock = estimate_clock(chunks(), trajectory, window_seconds=args.window, max_lag=args.max_lag)
+    print(f"Clock offset {clock.offset:.4f}s, drift {clock.drift * 1e6:.1f} ppm")
+
+    output = open(args.output, "w") if args.output else None
+    try:
+        accumulator, total, valid, mean_error = align(chunks(), trajectory, clock, ripples, hit_radius, output)
+    finally:
+        if output:
+            output.close()
+    print(f"{valid} of {total} gaze samples fall inside the session, mean error {mean_error:.1f}px")
+
+    rows = list(accumulator.rows())
+    for number, onset, status, count, mean, rms, hit_fraction in rows:
+        print(f"Ripple {number}: {status or '?':11s} {count:6d} samples, "
+              f"mean error {mean:7.1f}px, rms {rms:7.1f}px, on target {hit_fraction:6.1%}")
+    if args.summary:
+        with open(args.summary, "w") as f:
+            f.write("ripple,onset,status,samples,mean_error_px,rms_error_px,hit_fraction\n")
+            for row in rows:
+                f.write("%d,%.6f,%s,%d,%.3f,%.3f,%.4f\n" % row)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+import contextlib
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+
+def use_offscreen_pygame():
+    # SDL's dummy drivers let pygame.display.set_mode() hand back a plain
+    # surface, so frames can be composed without any monitor attached
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+
+def quiet_kivy():
+    # Keep Kivy from parsing our argv and from rewriting ~/.kivy/config.ini
+    # when a script calls Config.write() at import time
+    os.environ.setdefault("KIVY_NO_ARGS", "1")
+    os.environ.setdefault("KIVY_NO_CONFIG", "1")
+    os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+
+def start_virtual_display(width=3440, height=1440, display=":99"):
+    """ Start an Xvfb server when no display is available, returns the process (or None) """
+    if os.environ.get("DISPLAY"):
+        return None
+    if shutil.which("Xvfb") is None:
+        print("No DISPLAY set and Xvfb is not installed, GL backends will not start")
+        return None
+
+    process = subprocess.Popen(
+        ["Xvfb", display, "-screen", "0", f"{width}x{height}x24", "-nolisten", "tcp"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    time.sleep(0.5)  # Give the server a moment to accept connections
+    os.environ["DISPLAY"] = display
+    return process
+
+
+def stop_virtual_display(process):
+    if process is not None:
+        process.terminate()
+        process.wait()
+
+
+@contextlib.contextmanager
+def marker_workdir():
+    """ Run inside a scratch directory so the scripts' marker PNGs do not land in the repo """
+    previous = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="aruco_sim_")
+    os.makedirs(os.path.join(workdir, "ArucoMarker"), exist_ok=True)
+    os.chdir(workdir)
+    try:
+        yield workdir
+    finally:
+        os.chdir(previous)
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,63 @@
+from collections import OrderedDict
+import math
+
+import cv2
+import numpy as np
+import pygame
+
+
+class ShiftedMarkerCache:
+    """ LRU cache of marker surfaces resampled at fractional pixel offsets, for sub-pixel motion """
+
+    def __init__(self, marker_id=0, steps=8, max_entries=256):
+        self.marker_id = marker_id
+        self.steps = steps  # Offsets are quantized to 1/steps of a pixel on each axis
+        self.max_entries = max_entries
+        self.aruco_dict = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50)
+        self.bitmaps = {}
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def bitmap(self, marker_size):
+        if marker_size not in self.bitmaps:
+            self.bitmaps[marker_size] = cv2.aruco.generateImageMarker(self.aruco_dict, self.marker_id, marker_size)
+        return self.bitmaps[marker_size]
+
+    def lookup(self, x, y, marker_size):
+        """ Return (surface, left, top): blitting surface at the integer (left, top) shows the marker at (x, y) """
+        quantized_x = int(math.floor(x * self.steps + 0.5))
+        quantized_y = int(math.floor(y * self.steps + 0.5))
+        left, step_x = divmod(quantized_x, self.steps)
+        top, step_y = divmod(quantized_y, self.steps)
+
+        key = (marker_size, step_x, step_y)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            self.misses += 1
+            surface = self.render(marker_size, step_x / self.steps, step_y / self.steps)
+            self.surfaces[key] = surface
+            if len(self.surfaces) > self.max_entries:
+                self.surfaces.popitem(last=False)  # Drop the least recently used offset, whatever its size
+        else:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+        return surface, left, top
+
+    def render(self, marker_size, fraction_x, fraction_y):
+        # Bilinear resampling spreads each edge over at most one grey pixel, so the
+        # cell borders stay sharp enough for the detector
+        shift = np.float32([[1, 0, fraction_x], [0, 1, fraction_y]])
+        shifted = cv2.warpAffine(self.bitmap(marker_size), shift, (marker_size + 1, marker_size + 1),
+                                 flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=255)
+        rgb = cv2.cvtColor(shifted, cv2.COLOR_GRAY2RGB)
+        surface = pygame.image.frombuffer(rgb.tobytes(), (marker_size + 1, marker_size + 1), "RGB")
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert()  # Match the display format so blits stay on the fast path
+        else:
+            surface = surface.copy()
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
+        self.bitmaps.clear()
@@ -0,0 +1,310 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from batch_raster import BatchRasterizer, bounce_positions, marker_bitmap
+from path_planner import plan_path
+from session_log import SessionRecorder
+
+
+class AssetCache:
+    """ Marker bitmaps and textures shared by every screen, generated once per (marker_id, marker_size) """
+
+    def __init__(self):
+        self.bitmaps = {}
+        self.textures = {}
+
+    def bitmap(self, marker_id, marker_size):
+        key = (marker_id, marker_size)
+        if key not in self.bitmaps:
+            self.bitmaps[key] = marker_bitmap(marker_id, marker_size)
+        return self.bitmaps[key]
+
+    def texture(self, marker_id, marker_size):
+        # pyglet windows share one GL object space, so a texture made once works in every window
+        import pyglet
+        key = (marker_id, marker_size)
+        if key not in self.textures:
+            # Flip to pyglet's bottom-up rows, like new_pyglet_hor.py does
+            rgb = cv2.flip(cv2.cvtColor(self.bitmap(marker_id, marker_size), cv2.COLOR_GRAY2RGB), 0)
+            image = pyglet.image.ImageData(marker_size, marker_size, 'RGB', rgb.tobytes())
+            self.textures[key] = image.get_texture()
+        return self.textures[key]
+
+
+class ScreenConfig:
+    def __init__(self, positions, marker_id=0, marker_size=200, width=1920, height=1080,
+                 screen_index=0, session_dir=None):
+        self.positions = np.asarray(positions)  # (N, 2) marker top-left per tick, y pointing down
+        self.marker_id = marker_id
+        self.marker_size = marker_size
+        self.width = width
+        self.height = height
+        self.screen_index = screen_index
+        self.session_dir = session_dir
+
+
+class MultiScreenSimulation:
+    """ Several stimulus screens driven by one clock: every tick advances and submits all of them in one pass """
+
+    def __init__(self, configs, fps=60, monitor=None):
+        self.configs = configs
+        self.fps = fps
+        self.assets = AssetCache()
+        # Optional resource_monitor.ResourceMonitor, sampled once per tick
+        self.monitor = monitor
+        if monitor:
+            monitor.track("cached_textures", lambda: len(self.assets.textures))
+        self.frame = 0  # Index into the trajectories, held while paused
+        self.tick = 0  # Submitted ticks, the frame number recorded for every screen
+        self.paused = False
+        self.running = True
+        self.recorders = [SessionRecorder(config.session_dir, config={
+            "script": "multi_display.py", "screen_index": config.screen_index,
+            "marker_id": config.marker_id, "marker_size": config.marker_size,
+            "width": config.width, "height": config.height, "fps": fps,
+        }) if config.session_dir else None for config in configs]
+
+    @property
+    def length(self):
+        return max(len(config.positions) for config in self.configs)
+
+    def position(self, config):
+        # Screens with shorter trajectories hold their last position
+        return config.positions[min(self.frame, len(config.positions) - 1)]
+
+    def record(self, timestamp, positions):
+        # Every screen gets the same timestamp for the same tick
+        for recorder, config, (x, y) in zip(self.recorders, self.configs, positions):
+            if recorder:
+                half = config.marker_size / 2
+                recorder.record_frame(self.tick, timestamp, x + half, y + half)
+
+    def close(self):
+        for recorder in self.recorders:
+            if recorder:
+                recorder.close()
+        if self.monitor:
+            self.monitor.close()
+
+    def run_windows(self, fullscreen=False, vsync="first"):
+        """ vsync "first": only the first window waits for the refresh, so N windows cost one wait per tick,
+        but the others may tear on their own monitors. "all": no tearing anywhere, but the flips wait in
+        turn, which only keeps up when the monitors share a refresh clock. "none": tearing everywhere.
+        """
+        import pyglet
+        from pyglet.window import key
+
+        display = (pyglet.display if hasattr(pyglet, "display") else pyglet.canvas).get_display()
+        screens = display.get_screens()
+        windows = []
+        sprites = []
+        dots = []
+        batches = []
+        for index, config in enumerate(self.configs):
+            screen = screens[config.screen_index % len(screens)]
+            wait = vsync == "all" or (vsync == "first" and index == 0)
+            window = pyglet.window.Window(width=config.width, height=config.height, screen=screen,
+                                          fullscreen=fullscreen, vsync=wait,
+                                          caption=f"ArUco Marker Simulation {index}")
+            batch = pyglet.graphics.Batch()
+            sprites.append(pyglet.sprite.Sprite(self.assets.texture(config.marker_id, config.marker_size), batch=batch))
+            # One Circle per screen, moved every tick instead of re-created in every on_draw
+            dots.append(pyglet.shapes.Circle(0, 0, 10, color=(255, 0, 0), batch=batch))
+            batches.append(batch)
+            windows.append(window)
+
+            @window.event
+            def on_key_press(symbol, modifiers):
+                if symbol == key.SPACE:
+                    self.paused = not self.paused
+                elif symbol == key.ESCAPE:
+                    self.running = False
+
+            @window.event
+            def on_close():
+                self.running = False
+
+        pyglet.gl.glClearColor(1, 1, 1, 1)
+        interval = 1.0 / self.fps
+        next_tick = time.perf_counter()
+        while self.running and self.frame < self.length:
+            for window in windows:
+                window.dispatch_events()
+
+            timestamp = time.time()
+            positions = [self.position(config) for config in self.configs]
+            for config, sprite, dot, (x, y) in zip(self.configs, sprites, dots, positions):
+                # Trajectories use y down like the pygame scripts, pyglet's origin is bottom-left
+                flipped_y = config.height - y - config.marker_size
+                sprite.x, sprite.y = x, flipped_y
+                dot.x, dot.y = x + config.marker_size // 2, flipped_y + config.marker_size // 2
+
+            # Draw every window first, then flip them back to back so the screens change together
+            for window, batch in zip(windows, batches):
+                window.switch_to()
+                window.clear()
+                batch.draw()
+            for window in windows:
+                window.switch_to()
+                window.flip()
+            self.record(timestamp, positions)
+            if self.monitor:
+                self.monitor.sample()
+
+            self.tick += 1
+            if not self.paused:
+                self.frame += 1
+            next_tick += interval
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.perf_counter()  # Fell behind, do not try to catch up in a burst
+
+        for window in windows:
+            window.close()
+        self.close()
+
+    def run_headless(self, frames=None, keep_frames=False):
+        """ Same ticks without any window: every screen is rasterized into a NumPy array """
+        rasterizers = [BatchRasterizer(config.width, config.height,
+                                       self.assets.bitmap(config.marker_id, config.marker_size))
+                       for config in self.configs]
+        outputs = [rasterizer.allocate(1) for rasterizer in rasterizers]
+        kept = [[] for _ in self.configs]
+        total = self.length if frames is None else frames
+        timestamp = time.time()
+        while self.running and self.frame < total:
+            positions = [self.position(config) for config in self.configs]
+            for index, (rasterizer, output, position) in enumerate(zip(rasterizers, outputs, positions)):
+                rasterizer.render(np.asarray([position]), out=output)
+                if keep_frames:
+                    kept[index].append(output[0].copy())
+            # Simulated clock: ticks are exactly 1/fps apart however fast they really run
+            self.record(timestamp + self.tick / self.fps, positions)
+            if self.monitor:
+                self.monitor.sample()
+            self.tick += 1
+            self.frame += 1
+        self.close()
+        return [np.stack(frames_) for frames_ in kept] if keep_frames else None
+
+
+TRAJECTORIES = ("plan", "bounce")
+
+
+def parse_screen(text):
+    """ marker_id,marker_size,WIDTHxHEIGHT,trajectory[,monitor]: trajectory is plan, bounce or a .npy of positions """
+    fields = [field.strip() for field in text.split(",")]
+    if len(fields) not in (4, 5):
+        raise argparse.ArgumentTypeError(f"screens are marker_id,marker_size,WIDTHxHEIGHT,trajectory[,monitor], "
+                                         f"got {text!r}")
+    try:
+        width, height = (int(value) for value in fields[2].lower().split("x"))
+        spec = {"marker_id": int(fields[0]), "marker_size": int(fields[1]), "width": width, "height": height,
+                "trajectory": fields[3]}
+        if len(fields) == 5:
+            spec["monitor"] = int(fields[4])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"marker_id, marker_size, size and monitor must be integers, got {text!r}")
+    if spec["trajectory"] not in TRAJECTORIES and not spec["trajectory"].endswith(".npy"):
+        raise argparse.ArgumentTypeError(f"trajectory is plan, bounce or a .npy file, got {spec['trajectory']!r}")
+    return spec
+
+
+def load_screen_config(path):
+    # A JSON list of screens with the keys parse_screen produces
+    with open(path) as f:
+        specs = json.load(f)
+    for spec in specs:
+        missing = {"marker_id", "marker_size", "width", "height", "trajectory"} - set(spec)
+        if missing:
+            raise ValueError(f"{path}: screen {spec} lacks {', '.join(sorted(missing))}")
+    return specs
+
+
+def screen_configs(specs, speed, fps, session_root=None):
+    """ ScreenConfigs from per-screen specs; each screen gets its own trajectory, marker, size and monitor """
+    configs = []
+    for index, spec in enumerate(specs):
+        width, height, marker_size = spec["width"], spec["height"], spec["marker_size"]
+        trajectory = spec["trajectory"]
+        if trajectory == "plan":
+            positions = plan_path(width, height, marker_size, speed).positions()
+        elif trajectory == "bounce":
+            positions = bounce_positions(int(60 * fps), width, height, marker_size, speed, speed)
+        else:
+            positions = np.load(trajectory)  # (N, 2) marker top-left per tick, e.g. path_planner.py --output
+        session_dir = os.path.join(session_root, f"screen{index}") if session_root else None
+        configs.append(ScreenConfig(positions, marker_id=spec["marker_id"], marker_size=marker_size, width=width,
+                                    height=height, screen_index=spec.get("monitor", index), session_dir=session_dir))
+    return configs
+
+
+def default_specs(count, width, height, marker_size):
+    # Identical screens alternating between the planned path and a bounce, marker id = screen index
+    return [{"marker_id": index, "marker_size": marker_size, "width": width, "height": height,
+             "trajectory": TRAJECTORIES[index % 2]} for index in range(count)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive several stimulus screens from one process")
+    parser.add_argument("--screen", type=parse_screen, action="append", default=[],
+                        help="marker_id,marker_size,WIDTHxHEIGHT,trajectory[,monitor] for one screen, repeat per "
+                             "screen; trajectory is plan, bounce or a .npy of positions, monitor defaults to the order")
+    parser.add_argument("--config", help="JSON list of screens with the --screen fields as keys")
+    parser.add_argument("--screens", type=int, default=2, help="without --screen/--config: this many identical screens")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--marker-size", type=int, default=200)
+    parser.add_argument("--speed", type=float, default=6, help="pixels per tick")
+    parser.add_argument("--fps", type=float, default=60)
+    parser.add_argument("--fullscreen", action="store_true")
+    parser.add_argument("--vsync", choices=("first", "all", "none"), default="first",
+                        help="first: one refresh wait per tick, other screens may tear; all: no tearing, "
+                             "needs monitors on a common refresh clock")
+    parser.add_argument("--headless", action="store_true", help="render into arrays instead of windows")
+    parser.add_argument("--frames", type=int, help="stop after this many ticks")
+    parser.add_argument("--session-root", help="record one session per screen below this directory")
+    parser.add_argument("--monitor", action="store_true", help="watch memory, handles, sprites and textures "
+                                                               "with resource_monitor")
+    parser.add_argument("--monitor-log", help="CSV for the monitor's snapshots")
+    args = parser.parse_args(argv)
+
+    if args.screen and args.config:
+        parser.error("use either --screen or --config")
+    if args.config:
+        try:
+            specs = load_screen_config(args.config)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    else:
+        specs = args.screen or default_specs(args.screens, args.width, args.height, args.marker_size)
+    configs = screen_configs(specs, args.speed, args.fps, args.session_root)
+    monitor = None
+    if args.monitor or args.monitor_log:
+        from resource_monitor import ResourceMonitor, pyglet_types
+        # Live pyglet objects are only worth the heap walk when there are windows
+        monitor = ResourceMonitor(log_path=args.monitor_log, deep_types=None if args.headless else pyglet_types())
+    simulation = MultiScreenSimulation(configs, fps=args.fps, monitor=monitor)
+    start = time.perf_counter()
+    if args.headless:
+        simulation.run_headless(args.frames)
+    else:
+        if args.frames:
+            for config in configs:
+                config.positions = config.positions[:args.frames]
+        simulation.run_windows(args.fullscreen, args.vsync)
+    elapsed = time.perf_counter() - start
+    print(f"{simulation.frame} ticks on {len(configs)} screen(s) in {elapsed:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,5 @@
 import pyglet
+import argparse
 import random
 import cv2
 from kivy.config import Config
@@ -8,7 +9,7 @@ from pyglet.window import key
 
 
 class ArUcoVerticalSimulation(pyglet.window.Window):
-    def __init__(self, marker_id=0, marker_size=200, speed_x=3, speed_y=3):
+    def __init__(self, marker_id=0, marker_size=200, speed_x=3, speed_y=3, monitor=None):
         super(ArUcoVerticalSimulation, self).__init__(width=1920, height=1080)
 
         self.speed_x = speed_x
@@ -29,6 +30,8 @@ class ArUcoVerticalSimulation(pyglet.window.Window):
         marker_data = marker_image.tobytes()
         marker_texture = pyglet.image.ImageData(self.marker_size, self.marker_size, 'RGB', marker_data)
         self.marker_sprite = pyglet.sprite.Sprite(marker_texture)
+        # Red dot, created once and moved in on_draw instead of allocating a Circle every frame
+        self.dot = pyglet.shapes.Circle(0, 0, 10, color=(255, 0, 0))
 
         # Set the initial position of the marker
         self.marker_sprite.x = random.randint(0, self.width - self.marker_sprite.width)
@@ -49,6 +52,9 @@ class ArUcoVerticalSimulation(pyglet.window.Window):
         self.horizontal_movement = 0
         self.completed = False
 
+        # Optional resource_monitor.ResourceMonitor, sampled once per update
+        self.monitor = monitor
+
         pyglet.clock.schedule_interval(self.update, 1 / 60.0)
 
     def on_key_press(self, symbol, modifiers):
@@ -59,6 +65,8 @@ class ArUcoVerticalSimulation(pyglet.window.Window):
         elif symbol == key.ESCAPE:
             pyglet.app.exit()  # Exit the application
     def update(self, dt):
+        if self.monitor:
+            self.monitor.sample()
         if self.completed:
             pyglet.app.exit()
 
@@ -115,16 +123,28 @@ class ArUcoVerticalSimulation(pyglet.window.Window):
         pyglet.gl.glClearColor(1, 1, 1, 1)  # Set background to white
         self.marker_sprite.draw()
         # Draw the red dot at the center of the marker
-        center_x = self.current_x + self.marker_size // 2
-        center_y = self.current_y + self.marker_size // 2
-        pyglet.shapes.Circle(center_x, center_y, 10, color=(255, 0, 0)).draw()
+        self.dot.x = self.current_x + self.marker_size // 2
+        self.dot.y = self.current_y + self.marker_size // 2
+        self.dot.draw()
 
 
 if __name__ == '__main__':
-    sim = ArUcoVerticalSimulation()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--monitor", action="store_true", help="watch memory, handles, sprites and textures with resource_monitor")
+    parser.add_argument("--monitor-log", help="CSV for the monitor's snapshots")
+    args = parser.parse_args()
+    monitor = None
+    if args.monitor or args.monitor_log:
+        from resource_monitor import ResourceMonitor, pyglet_types
+        monitor = ResourceMonitor(log_path=args.monitor_log, deep_types=pyglet_types())
+    sim = ArUcoVerticalSimulation(monitor=monitor)
     Config.set('graphics', 'width', '1920')
     Config.set('graphics', 'height', '1080')
     Config.set('graphics', 'fullscreen', '1')  # Set to '1' for fullscreen
     Config.set('graphics', 'multisamples', '4')  # Anti-aliasing for smoother graphics
     Config.set('graphics', 'vsync', '1')  # Enable V-Sync for smoother animation
-    pyglet.app.run()
\ No newline at end of file
+    try:
+        pyglet.app.run()
+    finally:
+        if monitor:
+            monitor.close()
\ No newline at end of file
@@ -0,0 +1,335 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import sys
+
+import numpy as np
+
+CACHE_DIR = ".path_cache"
+PLAN_VERSION = 2  # Part of the cache key, bump it when the planner changes what it returns
+GRID_SIZE = 100  # grid_size of the raster sims
+PADDING = (30, 50, 30, 30)  # left, top, right, bottom, as in the raster sims
+
+
+class PlannedPath:
+    """ Ordered marker waypoints (top-left, screen pixels) plus the speed limits used to time them """
+
+    def __init__(self, waypoints, max_speed, max_accel=None):
+        self.waypoints = np.asarray(waypoints, dtype=np.float64)
+        self.max_speed = max_speed  # pixels per frame
+        self.max_accel = max_accel  # pixels per frame^2, None for instant speed changes
+        self.runs = straight_runs(self.waypoints)
+
+    @property
+    def length(self):
+        return float(np.hypot(*np.diff(self.waypoints, axis=0).T).sum())
+
+    def run_times(self):
+        # Frames needed for each straight run at the speed limits, stopping at every corner
+        lengths = np.hypot(*np.diff(self.runs, axis=0).T)
+        if self.max_accel is None:
+            return lengths / self.max_speed
+        ramp = self.max_speed ** 2 / self.max_accel  # Distance spent speeding up plus slowing down
+        return np.where(lengths >= ramp,
+                        lengths / self.max_speed + self.max_speed / self.max_accel,
+                        2 * np.sqrt(lengths / self.max_accel))
+
+    def run_frames(self):
+        # Every run is stretched to whole frames, so each corner is shown instead of cut between two frames
+        return np.ceil(self.run_times() - 1e-9)
+
+    @property
+    def frames(self):
+        return float(self.run_frames().sum())
+
+    def positions(self):
+        """ (N, 2) marker position for every frame, following the speed and acceleration limits """
+        durations = self.run_frames()
+        ends = np.cumsum(durations)
+        t = np.arange(0.0, ends[-1] if len(ends) else 0.0, 1.0)
+        if not len(t):
+            return self.waypoints[:1].copy()
+        run = np.minimum(np.searchsorted(ends, t, side="right"), len(durations) - 1)
+        # Time within the run on the unstretched profile, which only makes the run slightly slower
+        times = self.run_times()[run]
+        local = (t - (ends[run] - durations[run])) * times / durations[run]
+        lengths = np.hypot(*np.diff(self.runs, axis=0).T)[run]
+
+        if self.max_accel is None:
+            travelled = local * self.max_speed
+        else:
+            # Trapezoidal (or triangular, for short runs) speed profile per run
+            accel = self.max_accel
+            peak = np.minimum(self.max_speed, np.sqrt(lengths * accel))
+            ramp_time = peak / accel
+            cruise_time = times - 2 * ramp_time
+            speeding_up = local < ramp_time
+            cruising = ~speeding_up & (local < ramp_time + cruise_time)
+            remaining = times - local
+            travelled = np.where(speeding_up, 0.5 * accel * local ** 2,
+                                 np.where(cruising, 0.5 * peak * ramp_time + peak * (local - ramp_time),
+                                          lengths - 0.5 * accel * remaining ** 2))
+
+        fraction = np.clip(travelled / np.maximum(lengths, 1e-9), 0.0, 1.0)[:, None]
+        start = self.runs[run]
+        return np.vstack([start + (self.runs[run + 1] - start) * fraction, self.runs[-1:]])
+
+
+def straight_runs(waypoints):
+    # Merge consecutive collinear segments so only real corners cost a slow-down
+    if len(waypoints) < 3:
+        return waypoints
+    direction = np.diff(waypoints, axis=0)
+    cross = direction[:-1, 0] * direction[1:, 1] - direction[:-1, 1] * direction[1:, 0]
+    dot = (direction[:-1] * direction[1:]).sum(axis=1)
+    corner = (np.abs(cross) > 1e-6) | (dot < 0)
+    return np.vstack([waypoints[:1], waypoints[1:-1][corner], waypoints[-1:]])
+
+
+def padded_area(width, height, marker_size, padding=PADDING):
+    """ (low, high) corners of the box of marker top-left positions the padding allows """
+    left, top, right, bottom = padding
+    return (left, top), (width - right - marker_size, height - bottom - marker_size)
+
+
+def raster_pitch(speed, grid_size=GRID_SIZE):
+    # The raster sims step across in whole speed steps until they have moved grid_size, so rows end up this far apart
+    return math.ceil(grid_size / speed) * speed
+
+
+def lane_sweep(low, high, spacing, axis, flip_along=False, flip_across=False):
+    """ Snake of straight lanes along axis that brings every point of the low..high box within spacing / 2 of the path
+
+    The lanes are spread evenly, at most spacing apart and half a lane pitch in from the edges.
+    As the pitch is usually a bit under spacing, each lane stops short of the edge by as much as the
+    covering radius still allows; the flips pick which corner the sweep starts from.
+    """
+    low = np.asarray(low, dtype=np.float64)
+    high = np.asarray(high, dtype=np.float64)
+    across = 1 - axis
+    length = high[axis] - low[axis]
+    depth = high[across] - low[across]
+    count = max(1, math.ceil(depth / spacing - 1e-9))
+    pitch = depth / count
+    # Lane ends sit on the radius circle around the corners between two lanes
+    radius = spacing / 2
+    trim = min(math.sqrt(max(radius * radius - (pitch / 2) ** 2, 0.0)), length / 2)
+
+    waypoints = []
+    for lane in range(count):
+        offset = pitch * (lane + 0.5) if depth else 0.0
+        ends = [trim, length - trim]
+        if lane % 2:
+            ends.reverse()
+        for along in ends:
+            point = np.empty(2)
+            point[axis] = high[axis] - along if flip_along else low[axis] + along
+            point[across] = high[across] - offset if flip_across else low[across] + offset
+            waypoints.append(point)
+    return np.array(waypoints)
+
+
+def sweep_variants(low, high, spacing, axes=(0, 1)):
+    # Both lane directions from all four corners
+    return [lane_sweep(low, high, spacing, axis, flip_along, flip_across)
+            for axis in axes for flip_along in (False, True) for flip_across in (False, True)]
+
+
+def region_boxes(width, height, marker_size, padding, regions):
+    """ (low, high, weight) marker top-left boxes for the regions, which are given as marker-center screen rectangles """
+    (low_x, low_y), (high_x, high_y) = padded_area(width, height, marker_size, padding)
+    half = marker_size / 2
+    boxes = []
+    for region_x, region_y, region_w, region_h, weight in regions:
+        box_low = (max(low_x, region_x - half), max(low_y, region_y - half))
+        box_high = (min(high_x, region_x + region_w - half), min(high_y, region_y + region_h - half))
+        if box_low[0] > box_high[0] or box_low[1] > box_high[1] or weight <= 1:
+            continue
+        boxes.append((box_low, box_high, weight))
+    return boxes
+
+
+def coverage_plan(width, height, marker_size, padding, spacing, regions=(), start=None):
+    """ Waypoint candidates: the whole padded area swept at spacing, then every weighted region at spacing / weight
+
+    Region sweeps are visited nearest first from wherever the previous sweep ended (a nearest-neighbour tour),
+    each entered from its closest corner.
+    """
+    low, high = padded_area(width, height, marker_size, padding)
+    boxes = region_boxes(width, height, marker_size, padding, regions)
+
+    candidates = []
+    for axis in (0, 1):
+        bases = sweep_variants(low, high, spacing, axes=(axis,))
+        if start is None:
+            base = bases[0]  # From the top-left corner, where the raster sims start
+        else:
+            base = min(bases, key=lambda sweep: np.hypot(*(sweep[0] - start)))
+            base = np.vstack([np.asarray(start, dtype=np.float64)[None], base])
+        parts = [base]
+        remaining = list(boxes)
+        while remaining:
+            here = parts[-1][-1]
+            options = [(np.hypot(*(sweep[0] - here)), index, sweep)
+                       for index, (box_low, box_high, weight) in enumerate(remaining)
+                       for sweep in sweep_variants(box_low, box_high, spacing / weight)]
+            _, index, sweep = min(options, key=lambda option: option[:2])
+            parts.append(sweep)
+            remaining.pop(index)
+        candidates.append(np.vstack(parts))
+    return candidates
+
+
+def cache_key(**inputs):
+    return hashlib.sha1(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+_memory_cache = {}
+
+
+def plan_path(width, height, marker_size, max_speed, max_accel=None, padding=PADDING,
+              density=1.0, regions=(), start=None, grid_size=GRID_SIZE, cache_dir=CACHE_DIR):
+    """ Shortest-duration path that keeps every marker-center position within spacing / 2 of the marker's center path
+
+    density 1 uses the fixed raster's own row spacing (raster_pitch), so the plan covers the screen at least
+    as closely as the raster does; density 2 halves the spacing. Weighted regions are swept weight times denser.
+    """
+    regions = [list(region) for region in regions]
+    spacing = raster_pitch(max_speed, grid_size) / density
+    key = cache_key(version=PLAN_VERSION, width=width, height=height, marker_size=marker_size,
+                    max_speed=max_speed, max_accel=max_accel, padding=list(padding), spacing=spacing,
+                    regions=regions, start=list(start) if start is not None else None)
+    if key in _memory_cache:
+        return _memory_cache[key]
+
+    cache_file = os.path.join(cache_dir, key + ".npy") if cache_dir else None
+    if cache_file and os.path.exists(cache_file):
+        path = PlannedPath(np.load(cache_file), max_speed, max_accel)
+        _memory_cache[key] = path
+        return path
+
+    best = None
+    for waypoints in coverage_plan(width, height, marker_size, padding, spacing, regions, start):
+        candidate = PlannedPath(waypoints, max_speed, max_accel)
+        if best is None or candidate.frames < best.frames:
+            best = candidate
+
+    if cache_file:
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(cache_file, best.waypoints)
+    _memory_cache[key] = best
+    return best
+
+
+def raster_positions(width, height, marker_size, speed_x=30, speed_y=30, grid_size=GRID_SIZE, padding=PADDING,
+                     vertical=False):
+    """ Per-frame marker positions of the fixed raster, stepped exactly like move_marker in the raster sims
+
+    vertical follows aruco_sim_vertical.py (columns), otherwise aruco_sim_horizontal.py (rows).
+    The first row is the start position, one more row follows every move_marker call up to completion.
+    """
+    left, top, right, bottom = padding
+    if vertical:
+        # The vertical sim is the horizontal one with the axes swapped
+        positions = raster_positions(height, width, marker_size, speed_y, speed_x, grid_size,
+                                     (top, left, bottom, right))
+        return positions[:, ::-1].copy()
+
+    padded_left, padded_right = left, width - right - marker_size
+    padded_top, padded_bottom = top, height - bottom - marker_size
+    x, y = padded_left, padded_top
+    direction_x, direction_y = 1, 0
+    moved = 0
+    positions = [(x, y)]
+    while True:
+        if direction_x:
+            x += speed_x * direction_x
+            if x >= padded_right or x <= padded_left:
+                x = padded_right if x >= padded_right else padded_left
+                direction_x, direction_y, moved = 0, 1, 0
+        elif direction_y:
+            y += speed_y * direction_y
+            moved += speed_y * direction_y
+            if moved >= grid_size:
+                y = min(max(y, padded_top), padded_bottom)
+                direction_y = 0
+                direction_x = -1 if x == padded_right else 1
+                moved = 0
+        else:
+            break  # Stranded between the edges, the sims would stop moving here too
+        x = max(padded_left, min(x, padded_right))
+        y = max(padded_top, min(y, padded_bottom))
+        positions.append((x, y))
+        if (x >= padded_right and y >= padded_bottom) or (x <= padded_left and y <= padded_top):
+            break
+    return np.array(positions, dtype=np.float64)
+
+
+def raster_frames(width, height, marker_size, speed_x=30, speed_y=30, grid_size=GRID_SIZE, padding=PADDING,
+                  vertical=False):
+    # move_marker calls until the raster sims report completed
+    return len(raster_positions(width, height, marker_size, speed_x, speed_y, grid_size, padding, vertical)) - 1
+
+
+def coverage_radius(positions, low, high, box=None):
+    """ Largest distance from any marker position in low..high (or only in box) to the path through positions
+
+    The marker center and top-left differ by a constant, so this is the worst gap the marker center leaves.
+    """
+    import cv2
+
+    canvas = np.full((int(high[1] - low[1]) + 1, int(high[0] - low[0]) + 1), 255, dtype=np.uint8)
+    points = np.rint(np.asarray(positions) - low).astype(np.int32)
+    cv2.polylines(canvas, [points.reshape(-1, 1, 2)], False, 0, 1)
+    distance = cv2.distanceTransform(canvas, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+    if box is not None:
+        (box_low_x, box_low_y), (box_high_x, box_high_y) = box
+        distance = distance[int(box_low_y - low[1]):int(box_high_y - low[1]) + 1,
+                            int(box_low_x - low[0]):int(box_high_x - low[0]) + 1]
+    return float(distance.max())
+
+
+def parse_region(text):
+    values = [float(value) for value in text.split(",")]
+    if len(values) != 5:
+        raise argparse.ArgumentTypeError("regions are x,y,width,height,weight")
+    return values
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plan a short coverage path for the calibration marker")
+    parser.add_argument("--width", type=int, default=3440)
+    parser.add_argument("--height", type=int, default=1400)
+    parser.add_argument("--marker-size", type=int, default=300)
+    parser.add_argument("--speed", type=float, default=30, help="max speed in pixels per frame")
+    parser.add_argument("--accel", type=float, help="max acceleration in pixels per frame^2")
+    parser.add_argument("--density", type=float, default=1.0,
+                        help="center sweeps per raster row spacing (1 = as close as the fixed raster)")
+    parser.add_argument("--region", type=parse_region, action="append", default=[],
+                        help="x,y,width,height,weight, may be repeated")
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--output", help="save the per-frame positions as .npy")
+    parser.add_argument("--no-cache", action="store_true", help=f"do not read or write {CACHE_DIR}/")
+    args = parser.parse_args(argv)
+
+    path = plan_path(args.width, args.height, args.marker_size, args.speed, args.accel,
+                     density=args.density, regions=args.region, cache_dir=None if args.no_cache else CACHE_DIR)
+    positions = path.positions()
+    low, high = padded_area(args.width, args.height, args.marker_size)
+    print(f"{len(path.waypoints)} waypoints, {len(path.runs) - 1} straight runs, {path.length:.0f}px")
+    print(f"Planned: {len(positions) - 1} frames ({(len(positions) - 1) / args.fps:.1f}s), "
+          f"largest gap {coverage_radius(positions, low, high):.0f}px")
+    for name, vertical in (("horizontal", False), ("vertical", True)):
+        raster = raster_positions(args.width, args.height, args.marker_size, args.speed, args.speed, vertical=vertical)
+        gap = coverage_radius(raster, low, high)
+        print(f"Fixed {name} raster: {len(raster) - 1} frames ({(len(raster) - 1) / args.fps:.1f}s), "
+              f"largest gap {gap:.0f}px")
+    if args.output:
+        np.save(args.output, positions)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
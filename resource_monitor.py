@@ -0,0 +1,299 @@
+import argparse
+import collections
+import contextlib
+import csv
+import gc
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import headless
+
+MB = 1024 * 1024
+
+
+def rss_bytes():
+    # /proc/self/statm is a single small read; resource only knows the peak, which never shrinks
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def open_handles():
+    """ (open file descriptors, of which sockets), from /proc on Linux, (0, 0) elsewhere """
+    try:
+        names = os.listdir("/proc/self/fd")
+    except OSError:
+        return 0, 0
+    sockets = 0
+    for name in names:
+        try:
+            if os.readlink(f"/proc/self/fd/{name}").startswith("socket:"):
+                sockets += 1
+        except OSError:
+            pass  # The descriptor listdir itself used is gone by now
+    return len(names), sockets
+
+
+def count_live(types):
+    """ Live instances per name for {name: type}, including objects the garbage collector does not track
+
+    pygame Surfaces are not GC tracked, so they are found through the containers that hold them.
+    This walks the whole heap: fine every few minutes or in a soak test, too slow to run per frame.
+    """
+    counts = dict.fromkeys(types, 0)
+    seen = set()
+    for container in gc.get_objects():
+        for obj in gc.get_referents(container):
+            if id(obj) in seen:
+                continue
+            for name, kind in types.items():
+                if isinstance(obj, kind):
+                    seen.add(id(obj))
+                    counts[name] += 1
+                    break
+    return counts
+
+
+def pyglet_types():
+    """ deep_types for the pyglet windows: live sprites, textures and shapes such as the marker's dot """
+    import pyglet
+    return {"sprites": pyglet.sprite.Sprite, "textures": pyglet.image.Texture, "shapes": pyglet.shapes.ShapeBase}
+
+
+def slope(times, values):
+    # Least-squares growth per second
+    count = len(times)
+    mean_t = sum(times) / count
+    mean_v = sum(values) / count
+    spread = sum((t - mean_t) ** 2 for t in times)
+    if not spread:
+        return 0.0
+    return sum((t - mean_t) * (v - mean_v) for t, v in zip(times, values)) / spread
+
+
+class ResourceMonitor:
+    """ Periodic RSS, tracemalloc and handle-count snapshots with growth warnings
+
+    Call sample() every frame, it returns immediately until interval seconds have passed.
+    A trend is flagged when the last window samples grow steadily by more than the limits.
+    """
+
+    def __init__(self, interval=60.0, window=10, warmup=2, trace=True, deep_types=None,
+                 rss_limit_mb=20.0, traced_limit_mb=10.0, handle_limit=20, soak=False, log_path=None,
+                 clock=time.monotonic, stream=None):
+        self.interval = interval
+        self.window = window
+        self.warmup = warmup  # Samples ignored while caches and pools fill up
+        self.trace = trace
+        self.deep_types = deep_types or {}
+        self.rss_limit = rss_limit_mb * MB  # Growth allowed across one window
+        self.traced_limit = traced_limit_mb * MB
+        self.handle_limit = handle_limit
+        self.soak = soak
+        self.clock = clock
+        # Bound now, so warnings still reach the terminal while the soak silences the sim's prints
+        self.stream = stream or sys.stdout
+
+        self.counters = {}
+        self.history = collections.deque(maxlen=window)
+        self.samples = 0
+        self.last_sample = None
+        self.baseline = None
+        self.warnings = []
+        self.flagged = set()  # Quantities already reported, each is reported once
+        self.failed = False
+
+        self.log_file = None
+        self.log_writer = None
+        self.log_path = log_path
+
+        # Only a monitor that started tracing stops it again, someone else may be tracing too
+        self.started_trace = trace and not tracemalloc.is_tracing()
+        if self.started_trace:
+            tracemalloc.start(1)  # One frame per allocation keeps the tracing overhead low
+
+    def track(self, name, counter):
+        """ Add a count to every snapshot, counter is a callable returning an int """
+        self.counters[name] = counter
+
+    def snapshot(self, now):
+        fds, sockets = open_handles()
+        values = {"time": now, "rss": rss_bytes(), "fds": fds, "sockets": sockets}
+        if self.trace:
+            values["traced"] = tracemalloc.get_traced_memory()[0]
+        for name, counter in self.counters.items():
+            values[name] = counter()
+        if self.deep_types:
+            values.update(count_live(self.deep_types))
+        return values
+
+    def sample(self, now=None):
+        now = self.clock() if now is None else now
+        if self.last_sample is not None and now - self.last_sample < self.interval:
+            return None
+        self.last_sample = now
+        values = self.snapshot(now)
+        self.samples += 1
+        self.log(values)
+
+        if self.samples <= self.warmup:
+            return values
+        if self.trace and self.baseline is None:
+            self.baseline = tracemalloc.take_snapshot()
+        self.history.append(values)
+        if len(self.history) == self.window:
+            for problem in self.check():
+                self.report(problem)
+        return values
+
+    def check(self):
+        """ Quantities that grew across the whole window, steadily enough to not be noise """
+        times = [values["time"] for values in self.history]
+        span = times[-1] - times[0]
+        problems = []
+        limits = {"rss": self.rss_limit, "traced": self.traced_limit}
+        for name in self.history[0]:
+            if name == "time":
+                continue
+            series = [values[name] for values in self.history]
+            growth = series[-1] - series[0]
+            limit = limits.get(name, self.handle_limit)
+            # Steady: the fitted trend accounts for most of the growth, a single jump does not count
+            trend = slope(times, series) * span
+            if growth > limit and trend > 0.5 * growth and name not in self.flagged:
+                self.flagged.add(name)
+                if name in limits:
+                    problems.append(f"{name} grew {growth / MB:.1f} MB in {span / 60:.0f} min "
+                                    f"({trend / span * 3600 / MB:.1f} MB/h)")
+                else:
+                    problems.append(f"{name} grew from {series[0]} to {series[-1]} in {span / 60:.0f} min")
+        return problems
+
+    def report(self, problem):
+        self.warnings.append(problem)
+        print(f"Resource warning: {problem}", file=self.stream)
+        if self.trace and self.baseline is not None and problem.startswith("traced"):
+            # Point at the source lines that allocated the growth
+            for stat in tracemalloc.take_snapshot().compare_to(self.baseline, "lineno")[:3]:
+                print(f"    {stat}", file=self.stream)
+        if self.soak:
+            self.failed = True
+
+    def log(self, values):
+        if not self.log_path:
+            return
+        if self.log_writer is None:
+            self.log_file = open(self.log_path, "w", newline="")
+            self.log_writer = csv.DictWriter(self.log_file, fieldnames=list(values))
+            self.log_writer.writeheader()
+        self.log_writer.writerow(values)
+        self.log_file.flush()
+
+    def close(self):
+        if self.log_file:
+            self.log_file.close()
+            self.log_file = None
+        if self.started_trace and tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self.started_trace = False
+
+
+class SimulatedClock:
+    """ Stand-in for time.time that only moves when advanced """
+
+    def __init__(self, start=None):
+        self.now = time.time() if start is None else start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def soak(script="horizontal", hours=4.0, fps=30, interval=300.0, draw_every=10, metrics_channel=True,
+         log_path=None, seed=0, verbose=False):
+    """ Run a simulated session of the given length headless, as fast as the CPU allows
+
+    The sim's clock is replaced by a SimulatedClock, the path restarts whenever it completes,
+    every ripple is answered with a click 70% of the time, and a frame is composed every draw_every ticks.
+    The sim's own prints (a line per ripple, a failed send per message) are dropped unless verbose.
+    Returns the monitor, monitor.failed tells whether anything grew without bound.
+    """
+    headless.use_offscreen_pygame()
+    import pygame
+    if script == "vertical":
+        from aruco_sim_vertical import ArUcoSimulation
+    else:
+        from aruco_sim_horizontal import ArUcoSimulation
+
+    rng = random.Random(seed)
+    clock = SimulatedClock()
+    # A port that is bound but never listened on: connects are refused, so metrics_channel exercises the
+    # socket failure path without ever reaching a real event consumer on this machine
+    closed_port = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    closed_port.bind(("localhost", 0))
+    with closed_port, headless.marker_workdir(), tempfile.TemporaryDirectory() as session_root:
+        monitor = ResourceMonitor(interval=interval, soak=True, log_path=log_path, clock=clock,
+                                  deep_types={"surfaces": pygame.Surface})
+        sim = ArUcoSimulation(session_dir=os.path.join(session_root, "soak"), metrics_channel=metrics_channel,
+                              monitor=monitor)
+        sim.socket_address = closed_port.getsockname()
+        sim.now = clock
+        sim.countdown_start_time = clock()
+        sim.next_ripple_time = clock() + sim.ripple_interval
+        sim.extend_session = True
+        sim.show_metrics = True
+
+        frames = int(hours * 3600 * fps)
+        started = time.perf_counter()
+        with open(os.devnull, "w") as devnull, \
+                contextlib.redirect_stdout(sys.stdout if verbose else devnull):
+            for frame in range(frames):
+                if sim.ripple_active and not sim.user_looking_at_screen and rng.random() < 0.7 / fps:
+                    sim.handle_mouse_button_down(pygame.BUTTON_LEFT)
+                # step() records the frame and samples the monitor, exactly as in run()
+                sim.step(clock(), draw=frame % draw_every == 0)
+                clock.advance(1.0 / fps)
+
+        elapsed = time.perf_counter() - started
+        sim.recorder.close()
+        sim.close_socket()
+        pygame.quit()
+    monitor.close()
+    print(f"Simulated {hours:.1f} h ({frames} frames, {sim.ripple_count} ripples) in {elapsed:.0f} s, "
+          f"{monitor.samples} snapshots")
+    return monitor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless soak test: a simulated long session under the resource monitor")
+    parser.add_argument("--script", choices=("horizontal", "vertical"), default="horizontal")
+    parser.add_argument("--hours", type=float, default=4.0, help="simulated session length")
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--interval", type=float, default=300.0, help="simulated seconds between snapshots")
+    parser.add_argument("--draw-every", type=int, default=10, help="compose one frame in this many ticks")
+    parser.add_argument("--log", help="write every snapshot to this CSV")
+    parser.add_argument("--verbose", action="store_true", help="keep the sim's per-ripple and socket messages")
+    args = parser.parse_args(argv)
+
+    monitor = soak(args.script, args.hours, args.fps, args.interval, args.draw_every, log_path=args.log,
+                   verbose=args.verbose)
+    if monitor.failed:
+        print(f"Soak test failed: {len(monitor.warnings)} growth warning(s)")
+        return 1
+    print("Soak test passed: no unbounded growth")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
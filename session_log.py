@@ -0,0 +1,64 @@
+import csv
+import json
+import os
+import time
+import uuid
+
+import numpy as np
+
+TRAJECTORY_FILE = "trajectory.csv"
+EVENTS_FILE = "events.csv"
+CONFIG_FILE = "config.json"
+
+
+class SessionRecorder:
+    """ Writes what a simulation showed: marker center per frame, ripple events and the run's config """
+
+    def __init__(self, session_dir, config=None):
+        self.session_dir = session_dir
+        os.makedirs(session_dir, exist_ok=True)
+
+        # Directory names repeat across rigs and days, the id is what tells sessions apart later
+        config = dict(config or {})
+        config.setdefault("session_id", uuid.uuid4().hex)
+        config.setdefault("created", time.time())
+        self.session_id = config["session_id"]
+        with open(os.path.join(session_dir, CONFIG_FILE), "w") as f:
+            json.dump(config, f, indent=2, sort_keys=True)
+
+        self.trajectory_file = open(os.path.join(session_dir, TRAJECTORY_FILE), "w", newline="")
+        self.trajectory = csv.writer(self.trajectory_file)
+        self.trajectory.writerow(["frame", "time", "x", "y"])
+
+        self.events_file = open(os.path.join(session_dir, EVENTS_FILE), "w", newline="")
+        self.events = csv.writer(self.events_file)
+        self.events.writerow(["time", "ripple", "event", "status"])
+
+    def record_frame(self, frame, timestamp, x, y):
+        self.trajectory.writerow([frame, f"{timestamp:.6f}", x, y])
+
+    def record_event(self, timestamp, ripple, event, status=""):
+        self.events.writerow([f"{timestamp:.6f}", ripple, event, status])
+
+    def close(self):
+        self.trajectory_file.close()
+        self.events_file.close()
+
+
+def load_config(session_dir):
+    with open(os.path.join(session_dir, CONFIG_FILE)) as f:
+        return json.load(f)
+
+
+def load_trajectory(session_dir):
+    # Columns: frame, time, x, y (marker center in screen pixels)
+    return np.loadtxt(os.path.join(session_dir, TRAJECTORY_FILE), delimiter=",", skiprows=1, ndmin=2)
+
+
+def load_events(session_dir):
+    events = []
+    with open(os.path.join(session_dir, EVENTS_FILE), newline="") as f:
+        for row in csv.DictReader(f):
+            events.append({"time": float(row["time"]), "ripple": int(row["ripple"]),
+                           "event": row["event"], "status": row["status"]})
+    return events
@@ -0,0 +1,155 @@
+import json
+import math
+
+
+class SessionMetrics:
+    """ Running calibration-quality statistics, every update is constant time so it can run per frame """
+
+    def __init__(self, width, height, marker_size, fps=30, cell_size=100,
+                 reaction_bin=0.05, reaction_max=3.0, min_hit_rate=0.6, max_drop_rate=0.05, min_ripples=5):
+        self.width = width
+        self.height = height
+        self.marker_size = marker_size
+        self.frame_interval = 1.0 / fps
+
+        # Thresholds for the quality warnings
+        self.min_hit_rate = min_hit_rate
+        self.max_drop_rate = max_drop_rate
+        self.min_ripples = min_ripples
+
+        # Coverage: screen cells the marker footprint has touched so far
+        self.cell_size = cell_size
+        self.columns = math.ceil(width / cell_size)
+        self.rows = math.ceil(height / cell_size)
+        self.visited = bytearray(self.columns * self.rows)
+        self.visited_count = 0
+
+        # Frame timing
+        self.frames = 0
+        self.dropped_frames = 0
+        self.last_frame_time = None
+        self.pause_time = 0.0
+
+        # Ripples and reaction times (Welford running mean/variance plus a fixed histogram for percentiles)
+        self.ripples = 0
+        self.hits = 0
+        self.ripple_onset = None
+        self.responded = False
+        self.reactions = 0
+        self.reaction_mean = 0.0
+        self.reaction_m2 = 0.0
+        self.reaction_bin = reaction_bin
+        self.reaction_histogram = [0] * (int(reaction_max / reaction_bin) + 1)
+
+    def frame(self, timestamp, x, y, paused=False):
+        # x, y: marker top-left in screen pixels
+        if self.last_frame_time is not None:
+            interval = timestamp - self.last_frame_time
+            if paused:
+                self.pause_time += interval
+            elif interval > 1.5 * self.frame_interval:
+                self.dropped_frames += int(round(interval / self.frame_interval)) - 1
+        self.last_frame_time = timestamp
+        self.frames += 1
+        if not paused:
+            self.mark_footprint(x, y)
+
+    def mark_footprint(self, x, y):
+        # Touches at most (marker_size / cell_size + 1)^2 cells, independent of session length
+        first_column = max(0, int(x) // self.cell_size)
+        last_column = min(self.columns - 1, int(x + self.marker_size - 1) // self.cell_size)
+        first_row = max(0, int(y) // self.cell_size)
+        last_row = min(self.rows - 1, int(y + self.marker_size - 1) // self.cell_size)
+        for row in range(first_row, last_row + 1):
+            offset = row * self.columns
+            for column in range(first_column, last_column + 1):
+                if not self.visited[offset + column]:
+                    self.visited[offset + column] = 1
+                    self.visited_count += 1
+
+    def ripple_started(self, timestamp):
+        self.ripple_onset = timestamp
+        self.responded = False
+
+    def response(self, timestamp):
+        # Only the first click of a ripple counts as its reaction
+        if self.ripple_onset is None or self.responded:
+            return None
+        self.responded = True
+        reaction = timestamp - self.ripple_onset
+        self.reactions += 1
+        delta = reaction - self.reaction_mean
+        self.reaction_mean += delta / self.reactions
+        self.reaction_m2 += delta * (reaction - self.reaction_mean)
+        index = min(len(self.reaction_histogram) - 1, max(0, int(reaction / self.reaction_bin)))
+        self.reaction_histogram[index] += 1
+        return reaction
+
+    def ripple_finished(self, looking):
+        self.ripples += 1
+        if looking:
+            self.hits += 1
+        self.ripple_onset = None
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.ripples if self.ripples else 0.0
+
+    @property
+    def coverage(self):
+        return self.visited_count / len(self.visited)
+
+    @property
+    def drop_rate(self):
+        expected = self.frames + self.dropped_frames
+        return self.dropped_frames / expected if expected else 0.0
+
+    def reaction_percentile(self, fraction):
+        if not self.reactions:
+            return None
+        target = fraction * self.reactions
+        seen = 0
+        for index, count in enumerate(self.reaction_histogram):
+            seen += count
+            if seen >= target:
+                return round((index + 0.5) * self.reaction_bin, 4)
+        return len(self.reaction_histogram) * self.reaction_bin
+
+    def warnings(self):
+        problems = []
+        if self.ripples >= self.min_ripples and self.hit_rate < self.min_hit_rate:
+            problems.append(f"hit rate {self.hit_rate:.0%} below {self.min_hit_rate:.0%}")
+        if self.frames > 100 and self.drop_rate > self.max_drop_rate:
+            problems.append(f"{self.drop_rate:.1%} frames dropped")
+        return problems
+
+    def snapshot(self):
+        return {
+            "frames": self.frames,
+            "dropped_frames": self.dropped_frames,
+            "pause_time": round(self.pause_time, 3),
+            "ripples": self.ripples,
+            "hits": self.hits,
+            "hit_rate": round(self.hit_rate, 4),
+            "reaction_mean": round(self.reaction_mean, 4) if self.reactions else None,
+            "reaction_std": round(math.sqrt(self.reaction_m2 / (self.reactions - 1)), 4) if self.reactions > 1 else None,
+            "reaction_median": self.reaction_percentile(0.5),
+            "reaction_p90": self.reaction_percentile(0.9),
+            "coverage": round(self.coverage, 4),
+            "warnings": self.warnings(),
+        }
+
+    def to_message(self):
+        # One line for the event channel
+        return "METRICS " + json.dumps(self.snapshot(), sort_keys=True) + "\n"
+
+    def overlay_lines(self):
+        median = self.reaction_percentile(0.5)
+        lines = [
+            f"Ripples {self.ripples}  hit rate {self.hit_rate:.0%}",
+            f"Reaction median {median * 1000:.0f} ms" if median is not None else "Reaction median -",
+            f"Coverage {self.coverage:.0%}",
+            f"Dropped frames {self.dropped_frames}  paused {self.pause_time:.0f}s",
+        ]
+        lines.extend("WARNING: " + problem for problem in self.warnings())
+        return lines
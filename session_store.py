@@ -0,0 +1,404 @@
+import argparse
+import json
+import operator
+import os
+import re
+import shutil
+import sys
+
+import numpy as np
+
+import session_log
+from session_metrics import SessionMetrics
+
+INDEX_FILE = "index.json"
+TABLES = ("sessions", "ripples")
+SMALL_PART = 256  # Parts with fewer sessions than this get merged by compact()
+COMPACT_AFTER = 16  # Small parts tolerated before an ingest compacts them
+
+# Session config copied onto every ripple row, so ripple queries can group by it without a join
+CONFIG_COLUMNS = ("script", "marker_id", "marker_size", "speed_x", "speed_y")
+
+
+def session_key(config, trajectory, session_dir):
+    # Recorders write a unique session_id; older sessions fall back to directory name plus start time
+    if config.get("session_id"):
+        return config["session_id"]
+    start = int(trajectory[0, 1]) if len(trajectory) else 0
+    return f"{os.path.basename(os.path.normpath(session_dir))}-{start}"
+
+
+def summarize_session(session_dir):
+    """ One sessions row and the ripples rows for a SessionRecorder directory """
+    config = session_log.load_config(session_dir)
+    trajectory = session_log.load_trajectory(session_dir)
+    events = sorted(session_log.load_events(session_dir), key=lambda event: event["time"])
+    marker_size = config.get("marker_size", 300)
+    metrics = SessionMetrics(config.get("width", 3440), config.get("height", 1400), marker_size)
+
+    # Replay frames and events in time order through the same engine the live session uses
+    times = trajectory[:, 1]
+    event_index = 0
+    reactions = {}
+    looking = {}
+    onsets = {}
+    for t, x, y in zip(times, trajectory[:, 2] - marker_size / 2, trajectory[:, 3] - marker_size / 2):
+        while event_index < len(events) and events[event_index]["time"] <= t:
+            apply_event(metrics, events[event_index], onsets, reactions, looking)
+            event_index += 1
+        metrics.frame(t, x, y)
+    for event in events[event_index:]:
+        apply_event(metrics, event, onsets, reactions, looking)
+
+    intervals = np.diff(times) * 1000 if len(times) > 1 else np.zeros(1)
+    snapshot = metrics.snapshot()
+    session = {
+        "session": session_key(config, trajectory, session_dir),
+        "session_name": os.path.basename(os.path.normpath(session_dir)),
+        "script": config.get("script", ""),
+        "marker_id": config.get("marker_id", 0),
+        "marker_size": marker_size,
+        "speed_x": config.get("speed_x", 0),
+        "speed_y": config.get("speed_y", 0),
+        "start_time": float(times[0]) if len(times) else 0.0,
+        "duration": float(times[-1] - times[0]) if len(times) else 0.0,
+        "frames": len(times),
+        "dropped_frames": snapshot["dropped_frames"],
+        "frame_ms_p50": float(np.percentile(intervals, 50)),
+        "frame_ms_p95": float(np.percentile(intervals, 95)),
+        "frame_ms_max": float(intervals.max()),
+        "ripples": snapshot["ripples"],
+        "hits": snapshot["hits"],
+        "hit_rate": snapshot["hit_rate"],
+        "reaction_mean": np.nan if snapshot["reaction_mean"] is None else snapshot["reaction_mean"],
+        "reaction_median": np.nan if snapshot["reaction_median"] is None else snapshot["reaction_median"],
+        "coverage": snapshot["coverage"],
+    }
+    ripples = [dict({name: session[name] for name in ("session",) + CONFIG_COLUMNS},
+                    ripple=number, onset=onsets[number], looking=looking.get(number, False),
+                    reaction_time=reactions.get(number, np.nan))
+               for number in sorted(onsets)]
+    return session, ripples
+
+
+def apply_event(metrics, event, onsets, reactions, looking):
+    number = event["ripple"]
+    if event["event"] == "onset":
+        onsets[number] = event["time"]
+        metrics.ripple_started(event["time"])
+    elif event["event"] == "response":
+        reaction = metrics.response(event["time"])
+        if reaction is not None:
+            reactions[number] = reaction
+    elif event["event"] == "result":
+        looking[number] = event["status"] == "LOOKING"
+        metrics.ripple_finished(looking[number])
+
+
+class SessionStore:
+    """ Columnar store: one directory per table and part, one .npy file per column
+
+    Every ingest batch becomes a part, small parts are merged by compact() as they accumulate.
+
+    store/index.json                     parts and the sessions they contain
+    store/sessions/part-00000/<col>.npy
+    store/ripples/part-00000/<col>.npy
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.index_path = os.path.join(root, INDEX_FILE)
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        else:
+            self.index = {"parts": [], "sessions": {}}
+
+    def save_index(self):
+        os.makedirs(self.root, exist_ok=True)
+        temporary = self.index_path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(self.index, f, indent=1, sort_keys=True)
+        os.replace(temporary, self.index_path)  # Readers never see a half-written index
+
+    def ingest(self, session_dirs, compact_after=COMPACT_AFTER):
+        """ Add sessions as one new part; pass many directories at once to keep parts large """
+        sessions = []
+        ripples = []
+        added = set()
+        for session_dir in session_dirs:
+            session, session_ripples = summarize_session(session_dir)
+            key = session["session"]
+            if key in self.index["sessions"] or key in added:
+                print(f"Skipping {session_dir}, session {key} is already in the store")
+                continue
+            added.add(key)
+            sessions.append(session)
+            ripples.extend(session_ripples)
+        if not sessions:
+            return 0
+
+        part = self.new_part_name()
+        write_part(os.path.join(self.root, "sessions", part), sessions)
+        if ripples:
+            write_part(os.path.join(self.root, "ripples", part), ripples)
+        self.index["parts"].append(part)
+        for session in sessions:
+            self.index["sessions"][session["session"]] = part
+        self.save_index()
+
+        # The sims ingest one session per run, merge those tiny parts before they pile up
+        if compact_after and len(self.small_parts()) > compact_after:
+            self.compact()
+        return len(sessions)
+
+    def new_part_name(self):
+        used = [int(part.split("-")[1]) for part in self.index["parts"]]
+        return f"part-{max(used, default=-1) + 1:05d}"
+
+    def small_parts(self, small=SMALL_PART):
+        sizes = dict.fromkeys(self.index["parts"], 0)
+        for part in self.index["sessions"].values():
+            sizes[part] += 1
+        return [part for part in self.index["parts"] if sizes[part] < small]
+
+    def compact(self, small=SMALL_PART):
+        """ Merge all parts holding fewer than small sessions into one part, returns the number merged """
+        parts = self.small_parts(small)
+        if len(parts) < 2:
+            return 0
+        merged = self.new_part_name()
+        for table in TABLES:
+            paths = [os.path.join(self.root, table, part) for part in parts
+                     if os.path.isdir(os.path.join(self.root, table, part))]
+            if paths:
+                merge_parts(paths, os.path.join(self.root, table, merged))
+
+        # Swap the index over first, readers either see the old parts or the merged one
+        self.index["parts"] = [part for part in self.index["parts"] if part not in parts] + [merged]
+        for key, part in self.index["sessions"].items():
+            if part in parts:
+                self.index["sessions"][key] = merged
+        self.save_index()
+        for table in TABLES:
+            for part in parts:
+                shutil.rmtree(os.path.join(self.root, table, part), ignore_errors=True)
+        return len(parts)
+
+    def parts(self, table):
+        for part in self.index["parts"]:
+            path = os.path.join(self.root, table, part)
+            if os.path.isdir(path):
+                yield path
+
+    def column_names(self, table):
+        # Every column any part of the table has
+        names = set()
+        for path in self.parts(table):
+            names.update(filename[:-4] for filename in os.listdir(path) if filename.endswith(".npy"))
+        return names
+
+    def columns(self, table, names):
+        """ Yield {name: array} per part, memory-mapped so only the touched columns are read """
+        for path in self.parts(table):
+            length = len(np.load(os.path.join(path, "session.npy"), mmap_mode="r"))
+            columns = {}
+            for name in names:
+                column_path = os.path.join(path, name + ".npy")
+                # Parts written before a column existed read it as NaN
+                columns[name] = (np.load(column_path, mmap_mode="r") if os.path.exists(column_path)
+                                 else np.full(length, np.nan))
+            yield columns
+
+
+def write_part(path, rows):
+    os.makedirs(path, exist_ok=True)
+    for name in rows[0]:
+        values = [row[name] for row in rows]
+        if isinstance(values[0], str):
+            array = np.array(values, dtype=str)
+        elif isinstance(values[0], (bool, np.bool_)):
+            array = np.array(values, dtype=bool)
+        elif all(isinstance(value, (int, np.integer)) for value in values):
+            array = np.array(values, dtype=np.int64)
+        else:
+            array = np.array(values, dtype=np.float64)
+        np.save(os.path.join(path, name + ".npy"), array)
+
+
+def merge_parts(paths, target):
+    # Columns missing from older parts are filled with "" or NaN so every column keeps its length
+    columns = {}
+    for path in paths:
+        for filename in os.listdir(path):
+            if filename.endswith(".npy"):
+                columns.setdefault(filename[:-4], np.load(os.path.join(path, filename), mmap_mode="r").dtype)
+    os.makedirs(target, exist_ok=True)
+    for name, dtype in columns.items():
+        pieces = []
+        for path in paths:
+            length = len(np.load(os.path.join(path, "session.npy"), mmap_mode="r"))
+            column_path = os.path.join(path, name + ".npy")
+            if os.path.exists(column_path):
+                pieces.append(np.load(column_path))
+            elif dtype.kind == "U":
+                pieces.append(np.full(length, "", dtype=dtype))
+            else:
+                pieces.append(np.full(length, np.nan))
+        np.save(os.path.join(target, name + ".npy"), np.concatenate(pieces))
+
+
+OPERATORS = {"==": operator.eq, "!=": operator.ne, "<=": operator.le, ">=": operator.ge,
+             "<": operator.lt, ">": operator.gt}
+CONDITION = re.compile(r"^\s*(\w+)\s*(==|!=|<=|>=|<|>)\s*(.+?)\s*$")
+
+
+def parse_condition(text):
+    match = CONDITION.match(text)
+    if not match:
+        raise argparse.ArgumentTypeError(f"conditions look like speed_x>=20, got {text!r}")
+    name, op, value = match.groups()
+    try:
+        value = float(value)
+    except ValueError:
+        value = value.strip("'\"")
+    return name, OPERATORS[op], value
+
+
+def parse_aggregate(text):
+    # column:function, or just count
+    if text == "count":
+        return "count", None
+    name, _, function = text.partition(":")
+    if function not in ("sum", "mean", "min", "max"):
+        raise argparse.ArgumentTypeError(f"aggregates are column:sum|mean|min|max or count, got {text!r}")
+    return function, name
+
+
+def query(store, table, where=(), group_by=(), aggregates=(("count", None),)):
+    """ Filtered group-by aggregation, streamed part by part with running sums per group """
+    # "session" is always read so plain counts still see every row
+    needed = {"session"} | {name for name, _, _ in where} | set(group_by) | {name for _, name in aggregates if name}
+    # A misspelt column would read as all NaN and quietly match nothing
+    known = store.column_names(table)
+    unknown = needed - known
+    if known and unknown:
+        raise ValueError(f"unknown column(s) in {table}: {', '.join(sorted(unknown))}; "
+                         f"it has {', '.join(sorted(known))}")
+    totals = {}
+    for columns in store.columns(table, sorted(needed)):
+        length = len(columns["session"])
+        mask = np.ones(length, dtype=bool)
+        for name, compare, value in where:
+            mask &= compare(columns[name], value)
+        if not mask.any():
+            continue
+
+        if group_by:
+            keys = np.rec.fromarrays([np.asarray(columns[name])[mask] for name in group_by])
+            unique, inverse = np.unique(keys, return_inverse=True)
+            group_keys = [tuple(key.item() if hasattr(key, "item") else key for key in row) for row in unique]
+        else:
+            inverse = np.zeros(int(mask.sum()), dtype=np.int64)
+            group_keys = [()]
+
+        counts = np.bincount(inverse, minlength=len(group_keys))
+        partial = []
+        for function, name in aggregates:
+            if function == "count":
+                partial.append(counts)
+                continue
+            values = np.asarray(columns[name])[mask].astype(np.float64)
+            valid = ~np.isnan(values)
+            if function in ("sum", "mean"):
+                partial.append((np.bincount(inverse[valid], weights=values[valid], minlength=len(group_keys)),
+                                np.bincount(inverse[valid], minlength=len(group_keys))))
+            else:
+                reduce = np.fmin if function == "min" else np.fmax
+                result = np.full(len(group_keys), np.nan)
+                reduce.at(result, inverse[valid], values[valid])
+                partial.append(result)
+
+        for group, key in enumerate(group_keys):
+            entry = totals.setdefault(key, [None] * len(aggregates))
+            for i, (function, _) in enumerate(aggregates):
+                merge(entry, i, function, partial[i], group)
+
+    rows = []
+    for key in sorted(totals):
+        values = []
+        for (function, _), value in zip(aggregates, totals[key]):
+            if function == "mean":
+                values.append(value[0] / value[1] if value[1] else float("nan"))
+            elif function == "sum":
+                values.append(value[0])
+            else:
+                values.append(value)
+        rows.append(tuple(key) + tuple(values))
+    return rows
+
+
+def merge(entry, i, function, partial, group):
+    if function == "count":
+        entry[i] = (entry[i] or 0) + int(partial[group])
+    elif function in ("sum", "mean"):
+        total, count = entry[i] or (0.0, 0)
+        entry[i] = (total + float(partial[0][group]), count + int(partial[1][group]))
+    elif entry[i] is None or np.isnan(entry[i]):
+        entry[i] = float(partial[group])
+    elif not np.isnan(partial[group]):
+        entry[i] = (min if function == "min" else max)(entry[i], float(partial[group]))
+
+
+def format_rows(header, rows):
+    cells = [[str(name) for name in header]]
+    for row in rows:
+        cells.append([f"{value:.4g}" if isinstance(value, float) else str(value) for value in row])
+    widths = [max(len(row[i]) for row in cells) for i in range(len(header))]
+    return "\n".join("  ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in cells)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Store and query recorded simulation sessions")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = commands.add_parser("ingest", help="add SessionRecorder directories to the store")
+    ingest_parser.add_argument("store")
+    ingest_parser.add_argument("session_dirs", nargs="+")
+
+    compact_parser = commands.add_parser("compact", help="merge small parts so queries open fewer files")
+    compact_parser.add_argument("store")
+
+    query_parser = commands.add_parser("query", help="filtered aggregation over all sessions")
+    query_parser.add_argument("store")
+    query_parser.add_argument("--table", choices=TABLES, default="ripples")
+    query_parser.add_argument("--where", type=parse_condition, action="append", default=[],
+                              help="e.g. speed_x>=20 or script==aruco_sim_vertical.py, may be repeated")
+    query_parser.add_argument("--group-by", default="", help="comma separated columns")
+    query_parser.add_argument("--agg", type=parse_aggregate, action="append",
+                              help="column:sum|mean|min|max or count, may be repeated (default count)")
+    args = parser.parse_args(argv)
+
+    store = SessionStore(args.store)
+    if args.command == "ingest":
+        added = store.ingest(args.session_dirs)
+        print(f"Added {added} session(s), {len(store.index['sessions'])} in the store")
+        return 0
+    if args.command == "compact":
+        merged = store.compact()
+        print(f"Merged {merged} part(s), {len(store.index['parts'])} left")
+        return 0
+
+    group_by = [name for name in args.group_by.split(",") if name]
+    aggregates = args.agg or [("count", None)]
+    try:
+        rows = query(store, args.table, args.where, group_by, aggregates)
+    except ValueError as e:
+        query_parser.error(str(e))
+    header = group_by + [function if not name else f"{function}({name})" for function, name in aggregates]
+    print(format_rows(header, rows))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())